@@ -1,25 +1,144 @@
 # Entry point for the full pipeline
-import yaml
 import os
-import sys
 import argparse
-from modules import downloader, cleaner, transcriber, refiner, summarizer, vlm_generator, adverse_event_detector
-
-def load_config(config_path="config.yaml"):
-    if not os.path.exists(config_path):
-        print(f"Config file not found at {config_path}")
-        sys.exit(1)
-    with open(config_path, "r") as f:
-        return yaml.safe_load(f)
-
-def load_video_links(file_path):
-    if not os.path.exists(file_path):
-        print(f"⚠️ Warning: Video links file not found at {file_path}")
-        return []
-    with open(file_path, 'r') as f:
-        links = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-    print(f"ℹ️ Loaded {len(links)} URL(s) from {file_path}")
-    return links
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.pipeline_bootstrap import load_config, load_video_links
+# Step modules are imported inside their step: they pull in torch, whisper, google-genai
+# and pandas, which single-step runs should not pay for.
+
+# Max items waiting between two streaming stages (back-pressure on the faster stage)
+STAGE_QUEUE_SIZE = 4
+
+def run_streaming_stages(config, video_urls, videos_dir, audio_dir, transcripts_dir, refined_dir, metadata_file, cookies_file, log_file,
+                         refresh_cache=False):
+    """
+    Runs download, transcription and refinement concurrently: each finished item
+    is handed to the next stage through a bounded queue, so network, GPU and API
+    waits overlap. Downloads use up to `download.max_workers` threads, as in the
+    download step. Only freshly extracted audio is forwarded, and items whose
+    transcript or refined file already exists are not redone. Videos over the
+    duration limit are not forwarded; the cleaner still runs afterwards as a
+    barrier and removes them. At most `cerebras.max_files_per_run` transcripts are
+    refined; returns how many were, so the refine step can use the rest of the cap.
+    """
+    from modules import downloader, transcriber, refiner
+
+    max_seconds = config['download']['max_duration_seconds']
+    download_q = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    refine_q = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+
+    def downloader_worker():
+        try:
+            if not downloader.is_ffmpeg_installed():
+                print("⚠️ FFmpeg is not installed or not in your system PATH.")
+                return
+            with downloader.open_info_cache(videos_dir, refresh=refresh_cache) as info_cache, \
+                    downloader.MetadataLog(metadata_file) as metadata_log, \
+                    ThreadPoolExecutor(max_workers=downloader.audio_worker_count()) as audio_pool:
+
+                def extract_and_forward(entry, video_path):
+                    # Runs in the ffmpeg pool while the next video downloads. Audio that
+                    # already existed (video_path None) is left to the step-by-step passes.
+                    try:
+                        entry = downloader.finish_download(entry, video_path, audio_dir, metadata_log)
+                    except Exception as e:
+                        print(f"❌ Error extracting audio for {entry['url']}: {e}")
+                        return
+                    if video_path is None or not entry or entry['audio_filename'] in (None, "N/A"):
+                        return
+                    if float(entry['duration_seconds'] or 0) > max_seconds:
+                        return
+                    download_q.put(entry['audio_filename'])
+
+                def download(url):
+                    pending = downloader.download_video(url, videos_dir, audio_dir, metadata_log, cookies_file, info_cache)
+                    if pending is not None:
+                        audio_pool.submit(extract_and_forward, *pending)
+
+                urls = downloader.unique_video_urls(downloader.expand_urls(video_urls, cookies_file, info_cache))
+                with ThreadPoolExecutor(max_workers=config['download'].get('max_workers', 4)) as download_pool:
+                    for _ in download_pool.map(download, urls):
+                        pass
+                downloader.close_downloaders()
+            downloader.verify_and_process_existing_videos(videos_dir, audio_dir)
+        finally:
+            download_q.put(None)
+
+    def transcribe_worker():
+        try:
+            os.makedirs(transcripts_dir, exist_ok=True)
+            batch_size = config['whisper'].get('batch_size', 16)
+            model = None
+            while (audio_filename := download_q.get()) is not None:
+                # Load lazily so nothing is loaded when there is nothing new to transcribe
+                if model is None:
+                    model = transcriber.load_whisper_model(config['whisper']['model_size'], config['whisper']['device'],
+                                                           config['whisper'].get('compute_type'), batch_size)
+                    if model is None:
+                        model = False
+                if not model:
+                    continue
+                basename = os.path.splitext(audio_filename)[0]
+                output_path = os.path.join(transcripts_dir, f"{basename}.json")
+                if os.path.exists(output_path):
+                    # Already transcribed; the refiner skips it too if it is already refined
+                    refine_q.put(basename)
+                    continue
+                try:
+                    if transcriber.transcribe_file(model, os.path.join(audio_dir, audio_filename), output_path, batch_size=batch_size):
+                        refine_q.put(basename)
+                except Exception as e:
+                    # Keep draining the queue so the downloader never blocks on a dead consumer
+                    print(f"❌ Error transcribing {audio_filename}: {e}")
+        finally:
+            refine_q.put(None)
+
+    def refine_worker():
+        client = api_key = None
+        last_call = None
+        failure = None
+        max_files = config['cerebras']['max_files_per_run']
+        refined_count = 0
+        while (basename := refine_q.get()) is not None:
+            # Any failure disables refinement, but the queue keeps draining until the
+            # sentinel so the transcriber (and through it the downloader) never blocks
+            if os.path.exists(os.path.join(refined_dir, f"{basename}.txt")):
+                continue
+            if refined_count >= max_files:
+                # Cost cap reached: the rest waits for the next run
+                continue
+            if client is None:
+                try:
+                    client, api_key = refiner.setup_refiner_client(refined_dir, log_file)
+                except Exception as e:
+                    print(f"❌ Error setting up the refiner: {e}")
+                    failure = e
+                if client is None:
+                    client = False
+            if not client:
+                continue
+            try:
+                # Keep the configured spacing between API calls
+                if last_call is not None:
+                    time.sleep(max(0, config['cerebras']['api_call_delay_seconds'] - (time.monotonic() - last_call)))
+                if refiner.refine_transcript(client, api_key, config['cerebras']['model'], basename, transcripts_dir, videos_dir, refined_dir, log_file):
+                    refined_count += 1
+            except Exception as e:
+                print(f"❌ Error refining {basename}: {e}")
+            last_call = time.monotonic()
+        if client:
+            client.close()
+        if failure is not None:
+            raise failure
+        return refined_count
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(w) for w in (downloader_worker, transcribe_worker, refine_worker)]
+    for future in futures:
+        future.result()
+    return futures[2].result()
 
 def main():
     # 1. Parse Command Line Arguments
@@ -31,6 +150,11 @@ def main():
         choices=["all", "download", "clean", "transcribe", "refine", "summarize", "vlm", "adverse_event"],
         help="Specific pipeline step to run. Default is 'all' (runs sequentially)."
     )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Ignore cached yt-dlp lookups (videos/.info_cache) and fetch everything again."
+    )
     args = parser.parse_args()
 
     # 2. Load Config
@@ -51,39 +175,66 @@ def main():
     print(f"   VIDEO PIPELINE STARTED (Step: {args.step.upper()})")
     print("============================================")
 
+    # Steps 1, 3, 4 streamed: new downloads flow straight into transcription and refinement
+    streamed_refined = 0
+    if args.step == 'all':
+        print("\n[Steps 1-4] Running Downloader → Transcriber → Refiner concurrently...")
+        video_urls = load_video_links(links_file)
+        if video_urls:
+            streamed_refined = run_streaming_stages(config, video_urls, videos_dir, audio_dir, transcripts_dir, refined_dir, metadata_file, cookies_file, log_file,
+                                 refresh_cache=args.refresh_cache)
+        else:
+            print("❌ No URLs found. Skipping.")
+
     # Step 1: Downloader
-    if args.step in ['all', 'download']:
+    if args.step == 'download':
         print("\n[Step 1/7] Running Downloader...")
+        from modules import downloader
         video_urls = load_video_links(links_file)
         if video_urls:
-            downloader.run_downloader_pipeline(video_urls, videos_dir, audio_dir, metadata_file, cookies_file)
+            downloader.run_downloader_pipeline(video_urls, videos_dir, audio_dir, metadata_file, cookies_file,
+                                               max_workers=config['download'].get('max_workers', 4),
+                                               refresh_cache=args.refresh_cache)
         else:
             print("❌ No URLs found. Skipping.")
 
     # Step 2: Cleaner
     if args.step in ['all', 'clean']:
         print("\n[Step 2/7] Running Cleaner...")
+        from modules import cleaner
         cleaner.run_cleaner_pipeline(metadata_file, videos_dir, audio_dir, config['download']['max_duration_seconds'], auto_confirm=True)
 
-    # Step 3: Transcriber
+    # Step 3: Transcriber (with 'all', picks up audio the streaming stage did not handle)
     if args.step in ['all', 'transcribe']:
         print("\n[Step 3/7] Running Whisper Transcriber...")
-        transcriber.transcribe_audio_files(audio_dir, transcripts_dir, config['whisper']['model_size'], config['whisper']['device'])
+        from modules import transcriber
+        transcriber.transcribe_audio_files(audio_dir, transcripts_dir, config['whisper']['model_size'], config['whisper']['device'],
+                                           compute_type=config['whisper'].get('compute_type'),
+                                           batch_size=config['whisper'].get('batch_size', 16))
 
-    # Step 4: Refiner
+    # Step 4: Refiner (with 'all', picks up transcripts the streaming stage did not handle,
+    # within what is left of the per-run cap)
     if args.step in ['all', 'refine']:
         print("\n[Step 4/7] Running LLM Refiner...")
-        refiner.run_refiner_pipeline(transcripts_dir, videos_dir, refined_dir, log_file, config['cerebras']['model'], config['cerebras']['api_call_delay_seconds'], config['cerebras']['max_files_per_run'])
+        from modules import refiner
+        max_files = config['cerebras']['max_files_per_run'] - streamed_refined
+        if max_files > 0:
+            refiner.run_refiner_pipeline(transcripts_dir, videos_dir, refined_dir, log_file, config['cerebras']['model'], config['cerebras']['api_call_delay_seconds'], max_files,
+                                         max_concurrent=config['cerebras'].get('max_concurrent_requests', 4))
+        else:
+            print(f"⏩ Refinement cap reached ({streamed_refined} this run); the rest waits for the next run.")
 
     # Step 5: Summarizer
     if args.step in ['all', 'summarize']:
         print("\n[Step 5/7] Creating Dataset Summary...")
+        from modules import summarizer
         summarizer.create_dataset_info(metadata_file, log_file, summary_file)
     
     # Step 6: VLM Generator
     if args.step in ['all', 'vlm']:
         if 'vlm' in config:
             print("\n[Step 6/7] Generating VLM Fine-Tuning Dataset...")
+            from modules import vlm_generator
             
             # New Output Directory
             vlm_dir = config['directories']['vlm_dataset']
@@ -95,7 +246,12 @@ def main():
                 aggregate_filename=config['vlm']['aggregate_file'],
                 log_filename=config['vlm']['log_file'],
                 gatekeeper_model=config['vlm']['gatekeeper_model'],
-                generator_model=config['vlm']['generator_model']
+                generator_model=config['vlm']['generator_model'],
+                max_concurrency=config['vlm'].get('max_concurrency', 8),
+                gatekeeper_concurrency=config['vlm'].get('gatekeeper_concurrency', 16),
+                gatekeeper_rpm=config['vlm'].get('gatekeeper_rpm', 60),
+                generator_rpm=config['vlm'].get('generator_rpm', 8),
+                prefilter=config['vlm'].get('prefilter', True)
             )
         else:
             print("\n⚠️ Skipping VLM Generation (Config missing)")
@@ -104,12 +260,17 @@ def main():
     if args.step in ['all', 'adverse_event']:
         if 'adverse_event' in config:
             print("\n[Step 7/7] Running Adverse Event Detector...")
+            from modules import adverse_event_detector
             adverse_event_detector.run_adverse_event_pipeline(
                 vlm_input_dir=config['directories']['vlm_dataset'],
                 output_dir=config['directories']['adverse_events'],
                 log_filename=config['adverse_event']['log_file'],
                 aggregate_filename=config['adverse_event']['aggregate_file'],
-                model_name=config['adverse_event']['model']
+                model_name=config['adverse_event']['model'],
+                requests_per_minute=config['adverse_event'].get('requests_per_minute', 10),
+                max_workers=config['adverse_event'].get('max_workers', 4),
+                batch_size=config['adverse_event'].get('batch_size', 5),
+                keyword_prefilter=config['adverse_event'].get('keyword_prefilter', True)
             )
         else:
             print("\n⚠️ Skipping Adverse Event Detection (Config missing)")
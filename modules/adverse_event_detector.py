@@ -1,12 +1,26 @@
 import os
 import json
-import pandas as pd
 from tqdm import tqdm
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import csv
+import re
 import time
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# orjson is much faster; both variants return bytes from _json_dumps
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
 
 # --- PROMPT DEFINITION ---
 
@@ -14,7 +28,8 @@ SAFETY_ANALYST_PROMPT = """Role: You are a Surgical Safety Analyst specializing
 Task: Analyze the provided chronological list of surgical steps (visual descriptions) to detect any intraoperative adverse events or complications.
 
 Input Data:
-You will receive a list of steps. Each step has a timestamp and a visual description of the surgical action derived from the video.
+You will receive one or more surgeries. Each surgery starts with a line "=== VIDEO <video_id> ===" followed by its list of steps. Each step has a timestamp and a visual description of the surgical action derived from the video.
+Analyze every surgery independently; never attribute an event from one surgery to another.
 
 Adverse Events to Look For:
 You must strictly identify only the following complications based on the visual descriptions provided:
@@ -36,22 +51,61 @@ You must strictly identify only the following complications based on the visual
 Instructions:
 - Analyze the text strictly. Do not hallucinate events not described.
 - Infer complications from management actions: If the text describes "anterior vitrectomy", "sulcus IOL implantation", or "limbal approach for vitrectomy", you MUST infer that a Posterior Capsule Rupture (PCR) or Vitreous Loss occurred, even if the rupture itself wasn't explicitly described.
-- If NO adverse events are found, return an empty list for "adverse_events".
+- If NO adverse events are found for a surgery, return an empty list for its "adverse_events".
+- Return exactly one entry in "results" for every surgery in the input, using its video_id verbatim.
 
 Output Format:
 Return strictly a JSON object with the following structure:
 {
-  "adverse_events": [
+  "results": [
     {
-      "event_name": "Name of the complication (e.g., Posterior Capsule Rupture)",
-      "timestamp_start": "MM:SS (start of the event context)",
-      "timestamp_end": "MM:SS (end of the event context)",
-      "reason": "Quote or explanation from the visual description that indicates this event."
+      "video_id": "The video_id from the surgery's === VIDEO <video_id> === line",
+      "adverse_events": [
+        {
+          "event_name": "Name of the complication (e.g., Posterior Capsule Rupture)",
+          "timestamp_start": "MM:SS (start of the event context)",
+          "timestamp_end": "MM:SS (end of the event context)",
+          "reason": "Quote or explanation from the visual description that indicates this event."
+        }
+      ]
     }
   ]
 }
 """
 
+# Cheap gate before the LLM: a surgery whose steps mention none of these stems (the
+# signs listed in SAFETY_ANALYST_PROMPT) is logged as NO_EVENT_KEYWORD without an API
+# call. Can miss events, so it can be disabled. Plain "capsul" is left out on purpose:
+# every capsulorhexis would match it; only a posterior capsule mention counts.
+_EVENT_RE = re.compile(
+    r'\b(vitre|prolaps|ruptur|tear|drop|dialys|decentr|dislocat|subluxat|hemorrhag|haemorrhag|bleed'
+    r'|burn|whiten|gray|grey|miosis|constrict|billow|floppy|ifis|pcr|zonul|sulcus|equator|instab'
+    r'|breach|posterior\s+capsul)\w*',
+    re.IGNORECASE
+)
+
+# Static request pieces, built once and shared by every call
+_PROMPT_PART = types.Part.from_text(text=SAFETY_ANALYST_PROMPT)
+_JSON_CONFIG = types.GenerateContentConfig(response_mime_type="application/json")
+
+class RateLimiter:
+    """
+    Spaces calls evenly so that at most `requests_per_minute` start per minute.
+    Thread-safe: concurrent callers reserve consecutive slots.
+    """
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / max(requests_per_minute, 1)
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 def get_gemini_client():
     """Initializes the Google GenAI client."""
     try:
@@ -80,17 +134,36 @@ def setup_log_csv(log_path):
             writer = csv.writer(f)
             writer.writerow(headers)
 
-def append_to_log_csv(log_path, video_id, status, event_count):
-    """Appends a single row to the CSV log."""
-    with open(log_path, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
+class LogWriter:
+    """
+    Keeps the CSV log open for the whole run instead of reopening it per row.
+    The file is line-buffered, so every row still reaches the disk right away.
+    """
+    def __init__(self, log_path):
+        self._f = open(log_path, 'a', newline='', encoding='utf-8', buffering=1)
+        self._w = csv.writer(self._f)
+        atexit.register(self.close)
+
+    def write(self, video_id, status, event_count):
+        """Appends a single row to the CSV log."""
+        self._w.writerow([
             video_id,
             status,
             event_count,
             time.strftime("%Y-%m-%d %H:%M:%S")
         ])
 
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 def extract_visual_steps(vlm_data):
     """
     Formats the VLM annotations into a readable text format for the LLM.
@@ -99,19 +172,41 @@ def extract_visual_steps(vlm_data):
     if not annotations:
         return ""
     
-    text_context = "Surgical Steps Timeline:\n"
+    lines = ["Surgical Steps Timeline:"]
     for step in annotations:
         start = step.get("timestamp_start", "??:??")
         end = step.get("timestamp_end", "??:??")
         desc = step.get("visual_description", "")
-        text_context += f"[{start} - {end}]: {desc}\n"
+        lines.append(f"[{start} - {end}]: {desc}")
     
-    return text_context
+    return "\n".join(lines) + "\n"
 
-def detect_adverse_events(client, model_name, visual_context_text):
+def load_visual_context(vlm_input_dir, filename):
     """
-    Sends the visual descriptions to the LLM to find adverse events.
+    Reads one VLM JSONL file and formats its steps.
+    Returns (video_id, vlm_data, visual_context), or None if there is nothing to analyze.
     """
+    video_id = os.path.splitext(filename)[0]
+    with open(os.path.join(vlm_input_dir, filename), 'rb') as f:
+        # We assume the file has one JSON object per line, but for individual files usually just one line
+        line = f.readline()
+    if not line:
+        return None
+    vlm_data = _json_loads(line)
+
+    visual_context = extract_visual_steps(vlm_data)
+    if not visual_context:
+        tqdm.write(f"⚠️ No visual steps found for {video_id}, skipping.")
+        return None
+    return video_id, vlm_data, visual_context
+
+def detect_adverse_events(client, model_name, batch):
+    """
+    Sends the visual descriptions of several surgeries to the LLM in one request.
+    `batch` is a list of (video_id, visual_context_text) pairs.
+    Returns {video_id: adverse_events} for the videos the model answered, or None on API failure.
+    """
+    surgeries = "\n".join(f"=== VIDEO {video_id} ===\n{visual_context_text}" for video_id, visual_context_text in batch)
     try:
         response = client.models.generate_content(
             model=model_name,
@@ -119,21 +214,25 @@ def detect_adverse_events(client, model_name, visual_context_text):
                 types.Content(
                     role="user",
                     parts=[
-                        types.Part.from_text(text=SAFETY_ANALYST_PROMPT),
-                        types.Part.from_text(text=f"\nAnalyze this surgery:\n{visual_context_text}")
+                        _PROMPT_PART,
+                        types.Part.from_text(text=f"\nAnalyze these surgeries:\n{surgeries}")
                     ]
                 )
             ],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+            config=_JSON_CONFIG
         )
-        return json.loads(response.text)
+        result = _json_loads(response.text)
+        return {
+            str(item.get("video_id")): item.get("adverse_events", [])
+            for item in result.get("results", [])
+            if isinstance(item, dict)
+        }
     except Exception as e:
         print(f"  ⚠️ Adverse Event Detection failed: {e}")
         return None
 
-def run_adverse_event_pipeline(vlm_input_dir, output_dir, log_filename, aggregate_filename, model_name):
+def run_adverse_event_pipeline(vlm_input_dir, output_dir, log_filename, aggregate_filename, model_name,
+                               requests_per_minute=10, max_workers=4, batch_size=5, keyword_prefilter=True):
     print("\n=== ADVERSE EVENT DETECTION PIPELINE ===\n")
 
     client = get_gemini_client()
@@ -148,14 +247,21 @@ def run_adverse_event_pipeline(vlm_input_dir, output_dir, log_filename, aggregat
     setup_log_csv(log_file_path)
 
     # 2. Resuming Logic
-    # We check the log to see which videos are already fully processed (DETECTED or NO_EVENT)
+    # We check the log to see which videos are already fully processed (DETECTED or NO_EVENT).
+    # Keyword-gate skips only count while the gate is on, so disabling it re-checks them.
+    finished_statuses = {'DETECTED', 'NO_EVENT'}
+    if keyword_prefilter:
+        finished_statuses.add('NO_EVENT_KEYWORD')
     processed_ids = set()
     if os.path.exists(log_file_path):
         try:
-            log_df = pd.read_csv(log_file_path)
-            # We skip anything that was successfully checked (whether events were found or not)
-            finished_df = log_df[log_df['status'].isin(['DETECTED', 'NO_EVENT'])]
-            processed_ids = set(finished_df['video_id'].astype(str))
+            with open(log_file_path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # header
+                # We skip anything that was successfully checked (whether events were found or not)
+                for row in reader:
+                    if len(row) >= 2 and row[1] in finished_statuses:
+                        processed_ids.add(row[0])
             print(f"ℹ️ Resuming... {len(processed_ids)} videos already checked.")
         except Exception:
             pass
@@ -166,106 +272,130 @@ def run_adverse_event_pipeline(vlm_input_dir, output_dir, log_filename, aggregat
         print(f"❌ Input directory not found: {vlm_input_dir}")
         return
 
-    # Filter for .jsonl files but ignore the aggregate file from the previous step if it exists
-    input_files = [f for f in os.listdir(vlm_input_dir) if f.endswith('.jsonl') and "all.jsonl" not in f]
-    
-    if not input_files:
-        print("⚠️ No input VLM JSONL files found.")
-        return
-
-    print(f"Processing {len(input_files)} VLM files for safety analysis...\n")
-
     detected_count = 0
     clean_count = 0
     error_count = 0
     skipped_count = 0
+    prefiltered_count = 0
 
-    for filename in tqdm(input_files, desc="Scanning for Adverse Events"):
-        video_id = os.path.splitext(filename)[0]
-
-        # --- CHECK 1: Already Processed? ---
-        if video_id in processed_ids:
-            skipped_count += 1
-            continue
-
-        file_path = os.path.join(vlm_input_dir, filename)
-        
-        # Load VLM Data
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                # We assume the file has one JSON object per line, but for individual files usually just one line
-                line = f.readline()
-                if not line:
-                    continue
-                vlm_data = json.loads(line)
-        except Exception as e:
-            tqdm.write(f"❌ Error reading {filename}: {e}")
-            error_count += 1
+    # Filter for .jsonl files but ignore the aggregate file from the previous step if it exists.
+    # Already-processed videos are dropped during the same directory pass.
+    input_files = []
+    for entry in os.scandir(vlm_input_dir):
+        if not entry.name.endswith('.jsonl') or "all.jsonl" in entry.name or not entry.is_file():
             continue
-
-        # Extract Context
-        visual_context = extract_visual_steps(vlm_data)
-        if not visual_context:
-            tqdm.write(f"⚠️ No visual steps found for {video_id}, skipping.")
-            continue
-
-        # --- STEP 2: LLM ANALYSIS ---
-
-        
-        result = detect_adverse_events(client, model_name, visual_context)
-        # 30s delay to be safe with rate limits
-        time.sleep(30)
-
-        if result is None:
-            # API Error
-            append_to_log_csv(log_file_path, video_id, "ERROR", 0)
-            error_count += 1
+        if os.path.splitext(entry.name)[0] in processed_ids:
+            skipped_count += 1
             continue
+        input_files.append(entry.name)
+    
+    if not input_files:
+        if skipped_count:
+            print(f"✅ All {skipped_count} VLM files have already been checked.")
+        else:
+            print("⚠️ No input VLM JSONL files found.")
+        return
 
-        events = result.get("adverse_events", [])
-        
-        if events:
-            # === ADVERSE EVENTS DETECTED ===
-            detected_count += 1
-            
-            # Construct Output Object
-            # "I want the format of the first part of jsonl files be the same as the ones in vlm_dataset"
-            output_entry = {
-                "video_id": vlm_data.get("video_id"),
-                "original_filename": vlm_data.get("original_filename"),
-                "status": "DETECTED", # Updated status
-                "video_url": vlm_data.get("video_url"),
-                "video_title": vlm_data.get("video_title"),
-                "download_date": vlm_data.get("download_date"),
-                # We do NOT include the full 'vlm_annotations' to keep the focus on events,
-                # but we include the new events list.
-                "adverse_events": events
-            }
-
-            # 1. Save INDIVIDUAL JSONL
-            individual_output_path = os.path.join(output_dir, f"{video_id}.jsonl")
-            with open(individual_output_path, 'w', encoding='utf-8') as f:
-                f.write(json.dumps(output_entry) + "\n")
-
-            # 2. Append to AGGREGATE JSONL
-            with open(aggregate_file_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(output_entry) + "\n")
-            
-            # 3. Log
-            append_to_log_csv(log_file_path, video_id, "DETECTED", len(events))
-            tqdm.write(f"  🚨 Adverse Event Detected in {video_id}: {len(events)} event(s)")
+    print(f"Processing {len(input_files)} VLM files for safety analysis...\n")
 
-        else:
-            # === NO EVENTS (CLEAN) ===
-            clean_count += 1
-            # We do NOT save a JSONL file, but we MUST update the log so we don't check again.
-            append_to_log_csv(log_file_path, video_id, "NO_EVENT", 0)
+    # --- STEP 2: LLM ANALYSIS ---
+    # Each worker reads its batch of files and then calls the API, so disk reads overlap with
+    # other batches' requests. Several surgeries share one request, calls are latency-bound so
+    # several run at once, and the limiter keeps us within the RPM quota.
+    limiter = RateLimiter(requests_per_minute)
+    batches = [input_files[i:i + batch_size] for i in range(0, len(input_files), batch_size)]
+
+    def analyze(batch_files):
+        jobs, prefiltered_ids, read_errors = [], [], 0
+        for filename in batch_files:
+            try:
+                job = load_visual_context(vlm_input_dir, filename)
+            except Exception as e:
+                tqdm.write(f"❌ Error reading {filename}: {e}")
+                read_errors += 1
+                continue
+            if not job:
+                continue
+            if keyword_prefilter and not _EVENT_RE.search(job[2]):
+                prefiltered_ids.append(job[0])
+                continue
+            jobs.append(job)
+        if not jobs:
+            return jobs, prefiltered_ids, read_errors, {}
+        limiter.acquire()
+        results = detect_adverse_events(client, model_name, [(video_id, ctx) for video_id, _, ctx in jobs])
+        return jobs, prefiltered_ids, read_errors, results
+
+    # The aggregate file stays open (buffered) for the whole run and is flushed when the block exits
+    with LogWriter(log_file_path) as log_writer, \
+            open(aggregate_file_path, 'ab', buffering=1 << 16) as aggregate_f, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(analyze, batch): batch for batch in batches}
+
+        # Results are written from this thread only, so the log and JSONL files need no lock
+        with tqdm(total=len(input_files), desc="Scanning for Adverse Events") as pbar:
+            for future in as_completed(futures):
+                batch, prefiltered_ids, read_errors, results = future.result()
+                error_count += read_errors
+                pbar.update(len(futures[future]))
+
+                # No complication vocabulary at all: logged as clean without asking the model
+                for video_id in prefiltered_ids:
+                    prefiltered_count += 1
+                    log_writer.write(video_id, "NO_EVENT_KEYWORD", 0)
+
+                for video_id, vlm_data, _ in batch:
+                    if results is None or video_id not in results:
+                        # API Error, or the model left this video out of its answer
+                        log_writer.write(video_id, "ERROR", 0)
+                        error_count += 1
+                        continue
+
+                    events = results[video_id]
+                    
+                    if events:
+                        # === ADVERSE EVENTS DETECTED ===
+                        detected_count += 1
+                        
+                        # Construct Output Object
+                        # "I want the format of the first part of jsonl files be the same as the ones in vlm_dataset"
+                        output_entry = {
+                            "video_id": vlm_data.get("video_id"),
+                            "original_filename": vlm_data.get("original_filename"),
+                            "status": "DETECTED", # Updated status
+                            "video_url": vlm_data.get("video_url"),
+                            "video_title": vlm_data.get("video_title"),
+                            "download_date": vlm_data.get("download_date"),
+                            # We do NOT include the full 'vlm_annotations' to keep the focus on events,
+                            # but we include the new events list.
+                            "adverse_events": events
+                        }
+
+                        # 1. Save INDIVIDUAL JSONL
+                        payload = _json_dumps(output_entry) + b"\n"
+                        individual_output_path = os.path.join(output_dir, f"{video_id}.jsonl")
+                        with open(individual_output_path, 'wb') as f:
+                            f.write(payload)
+
+                        # 2. Append to AGGREGATE JSONL
+                        aggregate_f.write(payload)
+                        
+                        # 3. Log
+                        log_writer.write(video_id, "DETECTED", len(events))
+                        tqdm.write(f"  🚨 Adverse Event Detected in {video_id}: {len(events)} event(s)")
+
+                    else:
+                        # === NO EVENTS (CLEAN) ===
+                        clean_count += 1
+                        # We do NOT save a JSONL file, but we MUST update the log so we don't check again.
+                        log_writer.write(video_id, "NO_EVENT", 0)
 
     print("\n" + "="*30)
     print("   SAFETY ANALYSIS COMPLETED")
     print("="*30)
     print(f"🚨 Events Detected:  {detected_count}")
     print(f"✅ Clean Videos:     {clean_count}")
+    print(f"🔎 Clean (Keywords): {prefiltered_count}")
     print(f"⏭️ Skipped (Done):   {skipped_count}")
     print(f"❌ Errors:           {error_count}")
     print(f"📂 Output Folder:    {os.path.abspath(output_dir)}")
\ No newline at end of file
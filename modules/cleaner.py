@@ -1,90 +1,111 @@
 # Deletes files longer than the threshold
 import os
-import pandas as pd
+import csv
+import math
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 def find_videos_to_remove(metadata_path, max_seconds):
-    """Finds videos over the duration without deleting."""
+    """Finds videos over the duration without deleting. Returns (rows_to_keep, rows_to_remove, fieldnames)."""
     if not os.path.exists(metadata_path):
         print(f"❌ Error: Metadata file not found at '{metadata_path}'. Cannot proceed.")
-        return None, None
+        return None, None, None
 
     try:
-        df = pd.read_csv(metadata_path)
-    except pd.errors.EmptyDataError:
-        print("✅ Metadata file is empty. Nothing to clean up.")
-        return None, None
+        with open(metadata_path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames
+            rows = list(reader)
     except Exception as e:
         print(f"❌ Error reading metadata file: {e}")
-        return None, None
+        return None, None, None
+
+    if not fieldnames:
+        print("✅ Metadata file is empty. Nothing to clean up.")
+        return None, None, None
 
-    if 'duration_seconds' not in df.columns:
+    if 'duration_seconds' not in fieldnames:
         print("❌ Error: 'duration_seconds' column not found in metadata.")
-        return None, None
+        return None, None, None
 
-    df['duration_numeric'] = pd.to_numeric(df['duration_seconds'], errors='coerce')
-    to_keep_mask = df['duration_numeric'].fillna(0) <= max_seconds
+    rows_to_keep, rows_to_remove = [], []
+    for row in rows:
+        # Missing or non-numeric durations count as 0 and are kept
+        try:
+            duration = float(row.get('duration_seconds') or 0)
+        except ValueError:
+            duration = 0.0
+        if math.isnan(duration):
+            duration = 0.0
+        (rows_to_keep if duration <= max_seconds else rows_to_remove).append(row)
 
-    df_to_keep = df[to_keep_mask]
-    df_to_remove = df[~to_keep_mask]
+    return rows_to_keep, rows_to_remove, fieldnames
 
-    return df_to_keep, df_to_remove
 
+def describe_video(row):
+    """Returns the title of a metadata row, or its URL when the title is missing."""
+    return row.get('title') or f"URL: {row.get('url') or 'N/A'}"
 
-def delete_videos(df_to_remove, df_to_keep, metadata_path, videos_dir, audio_dir):
+
+def delete_videos(rows_to_remove, rows_to_keep, fieldnames, metadata_path, videos_dir, audio_dir):
     """Performs the actual deletion of files and updates the CSV."""
 
     print("\nProceeding with deletion...")
     removed_count = 0
 
-    for index, row in df_to_remove.iterrows():
-        video_name = row.get('filename')
-        audio_name = row.get('audio_filename')
-        title = row.get('title', f"URL: {row.get('url', 'N/A')}")
-
-        print(f"\nProcessing '{title}' (Duration: {row.get('duration_seconds')}s)")
-
-        # 1. Remove Video File
-        if pd.notna(video_name) and video_name not in ["FAILED", "SKIPPED_DURATION"]:
-            video_path = os.path.join(videos_dir, video_name)
-            if os.path.exists(video_path):
-                try:
-                    os.remove(video_path)
-                    print(f"  🗑️ Removed video: {video_path}")
-                    removed_count += 1
-                except Exception as e:
-                    print(f"  ❌ Error removing video {video_path}: {e}")
-            else:
-                print(f"  🤷 Video file not found: {video_path}")
-
-        # 2. Remove Audio File
-        if pd.notna(audio_name) and audio_name not in ["FAILED", "SKIPPED_DURATION"]:
-            audio_path = os.path.join(audio_dir, audio_name)
-            if os.path.exists(audio_path):
-                try:
-                    os.remove(audio_path)
-                    print(f"  🗑️ Removed audio: {audio_path}")
-                    removed_count += 1
-                except Exception as e:
-                    print(f"  ❌ Error removing audio {audio_path}: {e}")
-            else:
-                print(f"  🤷 Audio file not found: {audio_path}")
+    # Snapshot both folders once instead of stat-ing every path
+    existing_videos = {e.name for e in os.scandir(videos_dir)} if os.path.isdir(videos_dir) else set()
+    existing_audio = {e.name for e in os.scandir(audio_dir)} if os.path.isdir(audio_dir) else set()
+
+    # 1. Collect the video and audio files of every row
+    row_tasks = []
+    for row in rows_to_remove:
+        tasks = []
+        for kind, name, existing, folder in (
+            ("video", row.get('filename'), existing_videos, videos_dir),
+            ("audio", row.get('audio_filename'), existing_audio, audio_dir),
+        ):
+            if name and name not in ["FAILED", "SKIPPED_DURATION"]:
+                tasks.append((kind, os.path.join(folder, name), name in existing))
+        row_tasks.append(tasks)
+
+    def remove_file(task):
+        kind, path, exists = task
+        if exists:
+            try:
+                os.remove(path)
+                return f"  🗑️ Removed {kind}: {path}", True
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                return f"  ❌ Error removing {kind} {path}: {e}", False
+        return f"  🤷 {kind.capitalize()} file not found: {path}", False
+
+    # 2. Unlink everything concurrently; results come back in submission order
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = iter(executor.map(remove_file, [task for tasks in row_tasks for task in tasks]))
+
+        for row, tasks in zip(rows_to_remove, row_tasks):
+            print(f"\nProcessing '{describe_video(row)}' (Duration: {row.get('duration_seconds')}s)")
+            for _ in tasks:
+                message, removed = next(results)
+                print(message)
+                removed_count += removed
 
     # 3. Update the metadata CSV file
     try:
-        # Drop the temporary column before saving
-        if 'duration_numeric' in df_to_keep.columns:
-            df_to_keep = df_to_keep.drop(columns=['duration_numeric'])
-
-        df_to_keep.to_csv(metadata_path, index=False)
+        with open(metadata_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows_to_keep)
         print(f"\n✅ Successfully updated metadata file: {metadata_path}")
-        print(f"Removed {len(df_to_remove)} entries from CSV.")
+        print(f"Removed {len(rows_to_remove)} entries from CSV.")
     except Exception as e:
         print(f"❌ CRITICAL: Error writing updated metadata file: {e}")
         print("   Your files may be deleted, but the CSV was not updated.")
 
     print(f"\n--- Cleanup Summary ---")
-    print(f"Removed {len(df_to_remove)} videos from metadata.")
+    print(f"Removed {len(rows_to_remove)} videos from metadata.")
     print(f"Deleted {removed_count} associated files.")
     print("--- Cleanup Finished ---")
 
@@ -93,24 +114,18 @@ def run_cleaner_pipeline(metadata_file, videos_dir, audio_dir, max_duration_seco
     print(f"This script will find files over {max_duration_seconds} seconds.")
 
     # 1. Find videos
-    df_to_keep, df_to_remove = find_videos_to_remove(metadata_file, max_duration_seconds)
+    rows_to_keep, rows_to_remove, fieldnames = find_videos_to_remove(metadata_file, max_duration_seconds)
 
     # 2. Check results
-    if df_to_remove is None or df_to_remove.empty:
-        if df_to_remove is not None:
+    if not rows_to_remove:
+        if rows_to_remove is not None:
              print(f"✅ No videos found exceeding the {max_duration_seconds}s threshold.")
-             # Save DF to remove temp column if needed
-             if df_to_keep is not None and 'duration_numeric' in df_to_keep.columns:
-                 df_to_keep = df_to_keep.drop(columns=['duration_numeric'])
-                 df_to_keep.to_csv(metadata_file, index=False)
         return
 
     # 3. List videos
-    print(f"\nFound {len(df_to_remove)} video(s) to remove (duration > {max_duration_seconds}s):")
-    for index, row in df_to_remove.iterrows():
-        title = row.get('title', f"URL: {row.get('url', 'N/A')}")
-        duration = row.get('duration_seconds', 'N/A')
-        print(f"  - {title} (Duration: {duration}s)")
+    print(f"\nFound {len(rows_to_remove)} video(s) to remove (duration > {max_duration_seconds}s):")
+    for row in rows_to_remove:
+        print(f"  - {describe_video(row)} (Duration: {row.get('duration_seconds', 'N/A')}s)")
 
     # 4. Confirmation
     if auto_confirm:
@@ -122,6 +137,6 @@ def run_cleaner_pipeline(metadata_file, videos_dir, audio_dir, max_duration_seco
 
     # 5. Execute
     if proceed:
-        delete_videos(df_to_remove, df_to_keep, metadata_file, videos_dir, audio_dir)
+        delete_videos(rows_to_remove, rows_to_keep, fieldnames, metadata_file, videos_dir, audio_dir)
     else:
-        print("Operation cancelled by user.")
\ No newline at end of file
+        print("Operation cancelled by user.")
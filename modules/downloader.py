@@ -1,23 +1,59 @@
 # Handles YouTube downloads & FFmpeg extraction
 import yt_dlp
 import os
-import pandas as pd
 from datetime import datetime
 import shutil
 import subprocess
+import threading
 import time
+import csv
+import re
+import shelve
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tqdm.contrib.concurrent import thread_map
+
+# Metadata columns, in the order they are written to the CSV
+METADATA_COLUMNS = [
+    'title', 'channel_name', 'url', 'filename',
+    'download_date', 'duration_seconds', 'resolution', 'audio_filename'
+]
+
+# Input stream info that ffmpeg prints to stderr while extracting audio
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_RESOLUTION_RE = re.compile(r"Stream #\S+.*?: Video: .*?[ ,](\d{2,5})x(\d{2,5})")
+
+# One download YoutubeDL per thread, reused across videos (see _thread_downloader)
+_YDL_LOCAL = threading.local()
+_YDL_INSTANCES = []
+_YDL_INSTANCES_LOCK = threading.Lock()
+
+# shelve objects are not thread-safe
+_INFO_CACHE_LOCK = threading.Lock()
 
 def is_ffmpeg_installed():
     """Check if FFmpeg is installed and available in the system's PATH."""
     return shutil.which("ffmpeg") is not None
 
-def extract_audio_ffmpeg(video_filepath: str, audio_dir: str) -> str | None:
+def parse_ffmpeg_stream_info(stderr: str) -> dict:
+    """Parses the input duration (seconds) and video resolution from ffmpeg's stderr."""
+    stream_info = {}
+    if m := _DURATION_RE.search(stderr):
+        hours, minutes, seconds = m.groups()
+        stream_info['duration'] = round(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    if m := _RESOLUTION_RE.search(stderr):
+        stream_info['width'], stream_info['height'] = int(m.group(1)), int(m.group(2))
+    return stream_info
+
+def extract_audio_with_info(video_filepath: str, audio_dir: str) -> tuple[str | None, dict]:
     """
     Extracts audio from a video file using FFmpeg, converting it to 16kHz mono WAV.
+    The same ffmpeg run reports the input's duration and resolution, so no separate probe
+    is needed. Returns (audio_filename, stream_info); audio_filename is None on failure.
     """
     if not os.path.exists(video_filepath):
         print(f"❌ Error: Video file not found at {video_filepath}")
-        return None
+        return None, {}
 
     try:
         video_basename = os.path.basename(video_filepath)
@@ -28,60 +64,186 @@ def extract_audio_ffmpeg(video_filepath: str, audio_dir: str) -> str | None:
         print(f"🎵 Extracting audio from '{video_basename}'...")
 
         # Command to extract audio, convert to PCM 16-bit little-endian,
-        # set sample rate to 16kHz, mono channel, and overwrite output
+        # set sample rate to 16kHz, mono channel, and overwrite output.
+        # One thread per ffmpeg: batches run several ffmpeg processes side by side instead.
         command = [
-            'ffmpeg', '-i', video_filepath, '-vn', '-acodec', 'pcm_s16le',
+            'ffmpeg', '-hide_banner', '-nostats', '-threads', '1', '-i', video_filepath, '-vn', '-acodec', 'pcm_s16le',
             '-ar', '16000', '-ac', '1', '-y', output_audio_path
         ]
 
-        # Run ffmpeg, suppressing stdout and stderr to keep the log clean
-        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Run ffmpeg; stderr is kept only to read the input stream info
+        result = subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                text=True, errors='replace')
         print(f"✅ Audio extracted: {output_audio_path}")
-        return audio_filename
+        return audio_filename, parse_ffmpeg_stream_info(result.stderr)
 
     except subprocess.CalledProcessError:
         print(f"❌ FFmpeg error during audio extraction for {video_filepath}.")
-        return None
+        return None, {}
     except Exception as e:
         print(f"❌ Unexpected error during audio extraction: {e}")
-        return None
+        return None, {}
 
-def download_video_and_extract_audio(video_url: str,
-                                     output_dir: str,
-                                     audio_dir: str,
-                                     metadata_file: str,
-                                     cookie_file: str | None = None):
+def extract_audio_ffmpeg(video_filepath: str, audio_dir: str) -> str | None:
     """
-    Downloads a YouTube video, extracts its audio, logs metadata, and skips processed videos.
+    Extracts audio from a video file using FFmpeg, converting it to 16kHz mono WAV.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(audio_dir, exist_ok=True)
+    return extract_audio_with_info(video_filepath, audio_dir)[0]
 
-    # Define the metadata columns
-    metadata_columns = [
-        'title', 'channel_name', 'url', 'filename',
-        'download_date', 'duration_seconds', 'resolution', 'audio_filename'
-    ]
+class MetadataLog:
+    """
+    Append-only writer for the metadata CSV. The URLs already logged are read once;
+    each new row is appended and flushed instead of rewriting the whole file.
+    Safe to share between download threads.
+    """
+    def __init__(self, metadata_file: str):
+        self._lock = threading.Lock()
+        self.seen_urls = set()
+        fieldnames, rows = None, []
+        if os.path.exists(metadata_file):
+            with open(metadata_file, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                fieldnames = reader.fieldnames
+                rows = list(reader)
+            self.seen_urls = {row.get('url') for row in rows}
+
+        missing = [c for c in METADATA_COLUMNS if c not in (fieldnames or [])]
+        if fieldnames and missing:
+            # Older file without some columns: rewrite it once with the full header
+            fieldnames = fieldnames + missing
+            with open(metadata_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+
+        self._f = open(metadata_file, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._f, fieldnames=fieldnames or METADATA_COLUMNS, extrasaction='ignore')
+        if not fieldnames:
+            self._writer.writeheader()
+            self._f.flush()
+
+    def __contains__(self, url):
+        return url in self.seen_urls
+
+    def add(self, entry: dict) -> bool:
+        """Appends a row unless its URL is already logged. Returns True if it was written."""
+        with self._lock:
+            if entry['url'] in self.seen_urls:
+                return False
+            self._writer.writerow(entry)
+            self._f.flush()
+            self.seen_urls.add(entry['url'])
+            return True
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _video_cache_key(video_url: str) -> str:
+    """Cache key for a video: its YouTube id when the URL is a YouTube one, else the URL."""
+    try:
+        return f"info:{yt_dlp.extractor.youtube.YoutubeIE._match_id(video_url)}"
+    except Exception:
+        return f"info:{video_url}"
+
+def unique_video_urls(urls) -> list:
+    """
+    Drops URLs that point at a video already listed (youtu.be/ID, watch?v=ID&list=...
+    and watch?v=ID are the same video), keeping the first one, so two workers never
+    download the same file.
+    """
+    seen, unique = set(), []
+    for url in urls:
+        key = _video_cache_key(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+def _retry_after_seconds(error: yt_dlp.utils.DownloadError, attempt: int) -> int | None:
+    """
+    Seconds to wait before retrying a download that failed with HTTP 429/403: the
+    server's Retry-After header, else exponential backoff. None for any other error.
+    """
+    cause = error.exc_info[1] if error.exc_info else None
+    status = getattr(cause, 'status', None) or getattr(cause, 'code', None)
+    if status not in (403, 429):
+        return None
+    response = getattr(cause, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(cause, 'headers', None) or {}
+    try:
+        return min(int(headers.get('Retry-After')), 300)
+    except (TypeError, ValueError):
+        return 2 ** attempt
+
+def _video_info(ydl, full_info: dict) -> dict:
+    """The subset of yt-dlp's info that download_video needs (and the info cache keeps)."""
+    info = {k: full_info.get(k) for k in ('title', 'uploader', 'duration', 'width', 'height')}
+    info['filename'] = os.path.basename(ydl.prepare_filename(full_info))
+    return info
 
-    # Load or initialize metadata DataFrame
-    if os.path.exists(metadata_file):
+def _download_with_backoff(ydl, video_url: str, max_attempts: int = 4):
+    """
+    Downloads the video, backing off only when YouTube rate-limits the request.
+    Returns the fresh extractor info the file was named from.
+    """
+    for attempt in range(1, max_attempts + 1):
         try:
-            metadata_df = pd.read_csv(metadata_file)
-            # Ensure all required columns exist
-            for col in metadata_columns:
-                if col not in metadata_df.columns:
-                    metadata_df[col] = None
-            # Reorder columns
-            metadata_df = metadata_df[metadata_columns]
-        except pd.errors.EmptyDataError:
-            metadata_df = pd.DataFrame(columns=metadata_columns)
-    else:
-        metadata_df = pd.DataFrame(columns=metadata_columns)
+            return ydl.extract_info(video_url, download=True)
+        except yt_dlp.utils.DownloadError as e:
+            wait = _retry_after_seconds(e, attempt)
+            if wait is None or attempt == max_attempts:
+                raise
+            print(f"⏳ Rate limited on {video_url}, retrying in {wait}s...")
+            time.sleep(wait)
+
+def _thread_downloader(ydl_opts: dict):
+    """
+    Returns this thread's YoutubeDL for `ydl_opts`, creating it on first use, so
+    extractors, cookies and connections are set up once per worker instead of per video.
+    """
+    ydl = getattr(_YDL_LOCAL, 'ydl', None)
+    with _YDL_INSTANCES_LOCK:
+        # Instances closed by close_downloaders() are no longer listed
+        if ydl is not None and _YDL_LOCAL.opts == ydl_opts and ydl in _YDL_INSTANCES:
+            return ydl
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        _YDL_INSTANCES.append(ydl)
+    _YDL_LOCAL.ydl, _YDL_LOCAL.opts = ydl, ydl_opts
+    return ydl
+
+def close_downloaders():
+    """Closes the YoutubeDL instances created by download threads (saves their cookies)."""
+    with _YDL_INSTANCES_LOCK:
+        instances = _YDL_INSTANCES[:]
+        _YDL_INSTANCES.clear()
+    for ydl in instances:
+        ydl.close()
+
+def download_video(video_url: str,
+                   output_dir: str,
+                   audio_dir: str,
+                   metadata_log: MetadataLog,
+                   cookie_file: str | None = None,
+                   info_cache=None):
+    """
+    Downloads a YouTube video, skipping videos that are already logged.
+    Returns (entry, video_path) for finish_download(), where video_path is None when the
+    audio already exists, or None if there is nothing to do.
+    When `info_cache` is given, the video's metadata lookup is reused from earlier runs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(audio_dir, exist_ok=True)
 
     # Skip if video URL already processed
-    if video_url in metadata_df['url'].values:
+    if video_url in metadata_log:
         print(f"⏩ Video already in metadata (skipped): {video_url}")
-        return
+        return None
 
     # yt-dlp options
     ydl_opts = {
@@ -93,74 +255,96 @@ def download_video_and_extract_audio(video_url: str,
         'retries': 5,
         'fragment_retries': 5,
         'no_warnings': True,
+        'concurrent_fragment_downloads': 4,
     }
 
     if cookie_file and os.path.exists(cookie_file):
         ydl_opts['cookiefile'] = cookie_file
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract info first without downloading
-            info = ydl.extract_info(video_url, download=False)
-            video_title = str(info.get('title', 'Unknown Title'))
-            channel_name = info.get('uploader', 'Unknown Channel')
-            duration = info.get('duration')
-            width, height = info.get('width'), info.get('height')
-            resolution = f"{width}x{height}" if width and height else "N/A"
-
-            # Get the expected downloaded video path
-            expected_video_path = ydl.prepare_filename(info)
-            video_name_no_ext = os.path.splitext(os.path.basename(expected_video_path))[0]
-            expected_audio_filename = f"{video_name_no_ext}.wav"
-            expected_audio_path = os.path.join(audio_dir, expected_audio_filename)
-
-            # Skip if audio file already exists
-            if os.path.exists(expected_audio_path):
-                print(f"⏩ Audio already exists, assuming processed: {expected_audio_filename}")
-                # Log metadata if it was missing
-                if video_url not in metadata_df['url'].values:
-                    new_entry = pd.DataFrame([{
-                        'title': video_title,
-                        'channel_name': channel_name,
-                        'url': video_url,
-                        'filename': os.path.basename(expected_video_path),
-                        'download_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'duration_seconds': duration,
-                        'resolution': resolution,
-                        'audio_filename': expected_audio_filename
-                    }])
-                    metadata_df = pd.concat([metadata_df, new_entry], ignore_index=True)
-                    metadata_df.to_csv(metadata_file, index=False)
-                return
-
-            print(f"⬇️ Downloading: '{video_title}' from channel: {channel_name}")
-            ydl.download([video_url])
-
-            # Verify download and extract audio
-            if os.path.exists(expected_video_path):
-                print(f"✅ Download complete: {os.path.basename(expected_video_path)}")
-                audio_filename = extract_audio_ffmpeg(expected_video_path, audio_dir)
-
-                # Log new entry to metadata
-                new_entry = pd.DataFrame([{
-                    'title': video_title,
-                    'channel_name': channel_name,
-                    'url': video_url,
-                    'filename': os.path.basename(expected_video_path),
-                    'download_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'duration_seconds': duration,
-                    'resolution': resolution,
-                    'audio_filename': audio_filename if audio_filename else "N/A"
-                }])
-                metadata_df = pd.concat([metadata_df, new_entry], ignore_index=True)
-                metadata_df.to_csv(metadata_file, index=False)
-            else:
-                print(f"❌ Download reported success but file not found at '{expected_video_path}'")
+        ydl = _thread_downloader(ydl_opts)
+        # Extract info first without downloading (or reuse the cached subset we need)
+        cache_key = _video_cache_key(video_url)
+        info = None
+        if info_cache is not None:
+            with _INFO_CACHE_LOCK:
+                info = info_cache.get(cache_key)
+        if info is None:
+            info = _video_info(ydl, ydl.extract_info(video_url, download=False))
+            if info_cache is not None:
+                with _INFO_CACHE_LOCK:
+                    info_cache[cache_key] = info
+        video_title = str(info.get('title') or 'Unknown Title')
+        channel_name = info.get('uploader') or 'Unknown Channel'
+        width, height = info.get('width'), info.get('height')
+
+        # Get the expected downloaded video path
+        expected_video_path = os.path.join(output_dir, info['filename'])
+        video_name_no_ext = os.path.splitext(os.path.basename(expected_video_path))[0]
+        expected_audio_filename = f"{video_name_no_ext}.wav"
+        expected_audio_path = os.path.join(audio_dir, expected_audio_filename)
+
+        entry = {
+            'title': video_title,
+            'channel_name': channel_name,
+            'url': video_url,
+            'filename': os.path.basename(expected_video_path),
+            'download_date': None,
+            'duration_seconds': info.get('duration'),
+            'resolution': f"{width}x{height}" if width and height else "N/A",
+            'audio_filename': expected_audio_filename
+        }
+
+        # Skip if audio file already exists (metadata is still logged if it was missing)
+        if os.path.exists(expected_audio_path):
+            print(f"⏩ Audio already exists, assuming processed: {expected_audio_filename}")
+            return entry, None
+
+        print(f"⬇️ Downloading: '{video_title}' from channel: {channel_name}")
+        fresh_info = _video_info(ydl, _download_with_backoff(ydl, video_url))
+        if fresh_info['filename'] != info['filename']:
+            # The cached lookup is stale (e.g. the title changed since): the file was named
+            # from fresh info, so use and cache that instead
+            expected_video_path = os.path.join(output_dir, fresh_info['filename'])
+            entry['title'] = str(fresh_info.get('title') or 'Unknown Title')
+            entry['filename'] = fresh_info['filename']
+            entry['audio_filename'] = f"{os.path.splitext(fresh_info['filename'])[0]}.wav"
+            if info_cache is not None:
+                with _INFO_CACHE_LOCK:
+                    info_cache[cache_key] = fresh_info
+
+        # Verify download
+        if os.path.exists(expected_video_path):
+            print(f"✅ Download complete: {os.path.basename(expected_video_path)}")
+            return entry, expected_video_path
+        else:
+            print(f"❌ Download reported success but file not found at '{expected_video_path}'")
 
     except yt_dlp.utils.DownloadError as e:
         print(f"❌ yt-dlp Download Error for {video_url}: {e}")
     except Exception as e:
         print(f"❌ Unexpected error for {video_url}: {e}")
+    return None
+
+def finish_download(entry: dict, video_path: str | None, audio_dir: str, metadata_log: MetadataLog):
+    """
+    Extracts the audio of a downloaded video (when video_path is given) and logs its metadata.
+    Returns the logged entry, or None if the URL was already logged.
+    """
+    if video_path is not None:
+        audio_filename, stream_info = extract_audio_with_info(video_path, audio_dir)
+        entry['audio_filename'] = audio_filename if audio_filename else "N/A"
+        # Prefer what ffmpeg read from the downloaded file over yt-dlp's reported values
+        if 'duration' in stream_info:
+            entry['duration_seconds'] = stream_info['duration']
+        if 'width' in stream_info:
+            entry['resolution'] = f"{stream_info['width']}x{stream_info['height']}"
+    entry['download_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return entry if metadata_log.add(entry) else None
+
+def audio_worker_count() -> int:
+    """FFmpeg extraction workers: half the cores, leaving room for the downloads."""
+    return max(1, (os.cpu_count() or 2) // 2)
 
 def verify_and_process_existing_videos(videos_dir: str, audio_dir: str):
     """
@@ -171,9 +355,11 @@ def verify_and_process_existing_videos(videos_dir: str, audio_dir: str):
         print(f"❌ Verification skipped: '{videos_dir}' not found")
         return
 
-    # Get a set of audio filenames (without extension)
-    existing_audio_names = {os.path.splitext(f)[0] for f in os.listdir(audio_dir) if f.endswith('.wav')}
-    video_files = [f for f in os.listdir(videos_dir) if f.endswith(('.mp4', '.mkv', '.webm', '.mov'))]
+    # Get a set of audio filenames (without extension) in one scandir pass per folder
+    existing_audio_names = {e.name[:-4] for e in os.scandir(audio_dir)
+                            if e.name.endswith('.wav') and e.is_file(follow_symlinks=False)}
+    video_files = [e.name for e in os.scandir(videos_dir)
+                   if e.name.endswith(('.mp4', '.mkv', '.webm', '.mov')) and e.is_file(follow_symlinks=False)]
 
     # Find videos where the filename (without extension) is not in the audio set
     missing_audio_videos = [
@@ -190,65 +376,124 @@ def verify_and_process_existing_videos(videos_dir: str, audio_dir: str):
     for v in missing_audio_videos:
         print(f"  - {os.path.basename(v)}")
 
-    success, fail = 0, 0
-    for vpath in missing_audio_videos:
-        if extract_audio_ffmpeg(vpath, audio_dir):
-            success += 1
-        else:
-            fail += 1
+    # Each extraction is an independent ffmpeg subprocess, so threads are enough to run
+    # them side by side (no fork of this process, which may hold CUDA and HTTP threads)
+    results = thread_map(
+        partial(extract_audio_ffmpeg, audio_dir=audio_dir),
+        missing_audio_videos,
+        max_workers=audio_worker_count(),
+        desc="Extracting Audio"
+    )
+    success = sum(1 for r in results if r)
+    fail = len(results) - success
 
     print("\n--- Verification Summary ---")
     print(f"✅ Extracted: {success}")
     print(f"❌ Failed: {fail}")
 
-def run_downloader_pipeline(urls: list, videos_dir: str, audio_dir: str, metadata_file: str, cookie_file: str):
+def open_info_cache(videos_dir: str, refresh: bool = False):
     """
-    Main entry point for the downloader module.
+    Opens the on-disk cache of yt-dlp lookups kept next to the videos, so re-runs
+    can skip the extractor for URLs that were already inspected.
+    With refresh=True the cache is emptied first.
     """
-    if not is_ffmpeg_installed():
-        print("=" * 60)
-        print("⚠️ FFmpeg is not installed or not in your system PATH.")
-        return
+    os.makedirs(videos_dir, exist_ok=True)
+    return shelve.open(os.path.join(videos_dir, '.info_cache'), flag='n' if refresh else 'c')
 
+def expand_urls(urls: list, cookie_file: str | None = None, info_cache=None, max_workers: int = 8) -> list:
+    """
+    Inspects the given URLs (in parallel) and expands playlists into their individual video URLs.
+    URLs known from `info_cache` to be single videos are not inspected again; playlists always
+    are, since they can gain videos.
+    """
     # Handle playlists vs single videos
-    all_individual_urls = []
     info_opts = {
         'extract_flat': 'in_playlist',
         'skip_download': True,
         'quiet': True,
         'no_warnings': True,
+        'socket_timeout': 15,
     }
     if cookie_file and os.path.exists(cookie_file):
         info_opts['cookiefile'] = cookie_file
 
+    # One YoutubeDL per worker thread, reused for all the URLs that thread inspects
+    local = threading.local()
+    instances = []
+
+    def inspect(url):
+        key = f"inspect:{url}"
+        if info_cache is not None:
+            with _INFO_CACHE_LOCK:
+                if info_cache.get(key) == 'video':
+                    return [url], "  -> Single video (cached)."
+        ydl = getattr(local, 'ydl', None)
+        if ydl is None:
+            ydl = local.ydl = yt_dlp.YoutubeDL(info_opts)
+            instances.append(ydl)
+        try:
+            info = ydl.extract_info(url, download=False)
+        except Exception as e:
+            return [], f"  -> ❌ Error inspecting URL {url}: {e}"
+        if info.get('_type') == 'playlist':
+            playlist_video_urls = [entry.get('url') for entry in info.get('entries', []) if entry and entry.get('url')]
+            return playlist_video_urls, (f"  -> 🔗 Found playlist: {info.get('title', 'Unknown Playlist')}\n"
+                                         f"  -> Added {len(playlist_video_urls)} videos from playlist.")
+        if info_cache is not None:
+            with _INFO_CACHE_LOCK:
+                info_cache[key] = 'video'
+        return [url], "  -> Single video found."
+
     print("Inspecting provided URLs for playlists...")
-    with yt_dlp.YoutubeDL(info_opts) as ydl:
-        for url in urls:
+    all_individual_urls = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map() yields in input order, so the log and the URL order match the links file
+        for url, (found_urls, message) in zip(urls, executor.map(inspect, urls)):
             print(f"Inspecting: {url}")
-            try:
-                info = ydl.extract_info(url, download=False)
-                if info.get('_type') == 'playlist':
-                    print(f"  -> 🔗 Found playlist: {info.get('title', 'Unknown Playlist')}")
-                    playlist_video_urls = [entry.get('url') for entry in info.get('entries', []) if entry and entry.get('url')]
-                    all_individual_urls.extend(playlist_video_urls)
-                    print(f"  -> Added {len(playlist_video_urls)} videos from playlist.")
-                else:
-                    print("  -> Single video found.")
-                    all_individual_urls.append(url)
-            except Exception as e:
-                print(f"  -> ❌ Error inspecting URL {url}: {e}")
+            print(message)
+            all_individual_urls.extend(found_urls)
+    for ydl in instances:
+        ydl.close()
 
     print(f"\n--- Total individual videos to process: {len(all_individual_urls)} ---")
+    return all_individual_urls
+
+def run_downloader_pipeline(urls: list, videos_dir: str, audio_dir: str, metadata_file: str, cookie_file: str,
+                            max_workers: int = 4, refresh_cache: bool = False):
+    """
+    Main entry point for the downloader module. Downloads up to `max_workers` videos in parallel.
+    """
+    if not is_ffmpeg_installed():
+        print("=" * 60)
+        print("⚠️ FFmpeg is not installed or not in your system PATH.")
+        return
 
-    for i, video_url in enumerate(all_individual_urls):
-        download_video_and_extract_audio(
-            video_url,
-            output_dir=videos_dir,
-            audio_dir=audio_dir,
-            metadata_file=metadata_file,
-            cookie_file=cookie_file
-        )
-        if i < len(all_individual_urls) - 1:
-            time.sleep(1)
+    with open_info_cache(videos_dir, refresh=refresh_cache) as info_cache, MetadataLog(metadata_file) as metadata_log:
+        all_individual_urls = unique_video_urls(expand_urls(urls, cookie_file, info_cache))
+
+        # Downloads (network) and audio extraction (CPU) overlap: each finished download
+        # is handed to the ffmpeg pool while the download threads move on
+        with ThreadPoolExecutor(max_workers=audio_worker_count()) as audio_pool:
+            def extract(entry, video_path):
+                # Runs in the ffmpeg pool, whose futures are never read: report errors here
+                try:
+                    finish_download(entry, video_path, audio_dir, metadata_log)
+                except Exception as e:
+                    print(f"❌ Error extracting audio for {entry['url']}: {e}")
+
+            def worker(video_url):
+                pending = download_video(
+                    video_url,
+                    output_dir=videos_dir,
+                    audio_dir=audio_dir,
+                    metadata_log=metadata_log,
+                    cookie_file=cookie_file,
+                    info_cache=info_cache
+                )
+                if pending is not None:
+                    audio_pool.submit(extract, *pending)
+
+            thread_map(worker, all_individual_urls, max_workers=max_workers, desc="Downloading")
+            close_downloaders()
 
     verify_and_process_existing_videos(videos_dir, audio_dir)
\ No newline at end of file
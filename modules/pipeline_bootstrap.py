@@ -0,0 +1,42 @@
+# Config and input loading shared by the pipeline entry points
+import os
+import sys
+import yaml
+from functools import lru_cache
+
+# Prefer the libyaml C loader; fall back to the pure-Python one if PyYAML was built without it
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+@lru_cache(maxsize=8)
+def _parse_config(config_path, mtime_ns, size):
+    """
+    Parses the config. mtime_ns and size are only part of the cache key, so an
+    edited file is parsed again. The returned dict is shared: treat it as read-only.
+    """
+    with open(config_path, "r") as f:
+        return yaml.load(f, Loader=_Loader)
+
+def load_config(config_path="config.yaml"):
+    if not os.path.exists(config_path):
+        print(f"Config file not found at {config_path}")
+        sys.exit(1)
+    st = os.stat(config_path)
+    return _parse_config(config_path, st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=8)
+def _read_video_links(file_path, mtime_ns, size):
+    """Reads the URL list; mtime_ns and size only invalidate the cache when the file changes."""
+    with open(file_path, 'r') as f:
+        return tuple(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+def load_video_links(file_path):
+    if not os.path.exists(file_path):
+        print(f"⚠️ Warning: Video links file not found at {file_path}")
+        return []
+    st = os.stat(file_path)
+    links = list(_read_video_links(file_path, st.st_mtime_ns, st.st_size))
+    print(f"ℹ️ Loaded {len(links)} URL(s) from {file_path}")
+    return links
@@ -1,11 +1,27 @@
 import os
 import json
 import time
+import asyncio
+import threading
 from tqdm import tqdm
 import csv
-from cerebras.cloud.sdk import Cerebras
+import httpx
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from dotenv import load_dotenv
 
+# orjson is much faster than the stdlib json; _json_dumps returns an indented str in both variants
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
 MEDICAL_EDITOR_SYSTEM_PROMPT = """You are an expert JSON and medical editor. Your task is to correct typos, punctuation, and grammatical errors in a JSON file provided by the user, while preserving its exact structure.
 
 The user will provide a JSON array of segments from a cataract surgery video.
@@ -49,16 +65,17 @@ def get_api_key():
 
 def parse_llm_json_output(raw_output: str) -> str:
     THINK_END_TAG = "</think>"
-    if THINK_END_TAG in raw_output:
-        after_think = raw_output.split(THINK_END_TAG, 1)[1].strip()
-    else:
-        after_think = raw_output.strip()
+    # One scan for the tag, no list allocation; text after the first tag (or all of it)
+    before, tag, after_think = raw_output.partition(THINK_END_TAG)
+    after_think = (after_think if tag else before).strip()
 
     start = after_think.find("[")
-    end = after_think.rfind("]")
-
-    if start != -1 and end != -1 and end > start:
-        return after_think[start:end + 1].strip()
+    if start == -1:
+        return after_think
+    # The closing bracket can only come after the opening one
+    end = after_think.rfind("]", start + 1)
+    if end != -1:
+        return after_think[start:end + 1]
     return after_think
 
 def format_time_to_mm_ss(seconds: float) -> str:
@@ -77,31 +94,60 @@ def format_segments_to_txt(segments: list) -> str:
             continue
     return "\n".join(lines)
 
-def find_matching_video(videos_dir: str, basename: str) -> tuple[str, bool]:
+VIDEO_EXTS = {'.mp4','.mov','.avi','.mkv','.webm','.flv','.m4v','.wmv','.mpeg','.mpg'}
+
+def build_video_index(videos_dir: str) -> dict:
+    """Maps each lower-cased video name (without extension) to its filename."""
     if not os.path.isdir(videos_dir):
-        return "NOT_FOUND", False
-    target = basename.lower()
+        return {}
+    index = {}
     for filename in os.listdir(videos_dir):
         name, ext = os.path.splitext(filename)
-        if name.lower() == target and ext.lower() in {'.mp4','.mov','.avi','.mkv','.webm','.flv','.m4v','.wmv','.mpeg','.mpg'}:
-            return filename, True
-    return "NOT_FOUND", False
+        if ext.lower() in VIDEO_EXTS:
+            # Keep the first match, as the old per-call scan did
+            index.setdefault(name.lower(), filename)
+    return index
+
+def find_matching_video(videos_dir: str, basename: str, video_index: dict = None) -> tuple[str, bool]:
+    """Looks up the video for a transcript; pass a prebuilt `video_index` to avoid rescanning the folder."""
+    if video_index is None:
+        video_index = build_video_index(videos_dir)
+    filename = video_index.get(basename.lower())
+    return (filename, True) if filename else ("NOT_FOUND", False)
+
+def build_messages(text: str) -> list:
+    return [
+        {"role": "system", "content": MEDICAL_EDITOR_SYSTEM_PROMPT},
+        {"role": "user", "content": text}
+    ]
+
+def llm_error_response(e: Exception) -> str | None:
+    """Returns the placeholder response for context-limit errors, or None if the call should be retried."""
+    if any(x in str(e).lower() for x in ["context", "limit", "too large"]):
+        tqdm.write(f"Context limit exceeded: {e}")
+        return '{"error": "MODEL CONTEXT LIMIT EXCEEDED"}'
+    tqdm.write(f"API error: {e} → retrying in 10s...")
+    return None
 
 def refine_with_llm(text: str, model_name: str, api_key: str, client) -> str | None:
     try:
-        messages = [
-            {"role": "system", "content": MEDICAL_EDITOR_SYSTEM_PROMPT},
-            {"role": "user", "content": text}
-        ]
-        response = client.chat.completions.create(messages=messages, model=model_name)
+        response = client.chat.completions.create(messages=build_messages(text), model=model_name)
         return response.choices[0].message.content
     except Exception as e:
-        if any(x in str(e).lower() for x in ["context", "limit", "too large"]):
-            tqdm.write(f"Context limit exceeded: {e}")
-            return '{"error": "MODEL CONTEXT LIMIT EXCEEDED"}'
-        tqdm.write(f"API error: {e} → retrying in 10s...")
-        time.sleep(10)
-        return None
+        result = llm_error_response(e)
+        if result is None:
+            time.sleep(10)
+        return result
+
+async def refine_with_llm_async(text: str, model_name: str, client: AsyncCerebras) -> str | None:
+    try:
+        response = await client.chat.completions.create(messages=build_messages(text), model=model_name)
+        return response.choices[0].message.content
+    except Exception as e:
+        result = llm_error_response(e)
+        if result is None:
+            await asyncio.sleep(10)
+        return result
 
 def setup_csv_log(log_path):
     if os.path.exists(log_path):
@@ -110,84 +156,160 @@ def setup_csv_log(log_path):
         writer = csv.writer(f)
         writer.writerow(["video_name", "transcript_name", "total_characters", "total_words", "video_found", "success"])
 
+# Concurrent refinements append to the same log
+_LOG_LOCK = threading.Lock()
+
 def log_result(log_path, row: list):
-    with open(log_path, 'a', newline='', encoding='utf-8') as f:
+    with _LOG_LOCK, open(log_path, 'a', newline='', encoding='utf-8') as f:
         csv.writer(f).writerow(row)
 
-def run_refiner_pipeline(input_dir, videos_dir, refined_output_dir, log_path, model_name, delay, max_files):
-    print("\n=== TRANSCRIPT REFINEMENT PIPELINE ===\n")
+def load_transcript_payload(basename, input_dir) -> str | None:
+    """Loads a raw transcript ({basename}.json) as the LLM payload, or None if it is missing or empty."""
+    json_path = os.path.join(input_dir, f"{basename}.json")
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            segments = json.load(f)
+    except Exception as e:
+        tqdm.write(f"Failed to load {basename}.json → {e}")
+        return None
+
+    if not segments:
+        return None
+
+    return _json_dumps(segments)
+
+def save_refined_transcript(raw_response, basename, videos_dir, refined_output_dir, log_path, video_index=None):
+    """Saves the raw LLM response and the formatted transcript, and logs the result."""
     full_response_dir = os.path.join(refined_output_dir, 'full_responses')
-    
+    video_name, video_found = find_matching_video(videos_dir, basename, video_index)
+
+    txt_path = os.path.join(refined_output_dir, f"{basename}.txt")
+    full_path = os.path.join(full_response_dir, f"{basename}_full_response.txt")
+
+    with open(full_path, 'w', encoding='utf-8') as f:
+        f.write(raw_response)
+
+    success = False
+    total_chars = total_words = 0
+    try:
+        cleaned_json = parse_llm_json_output(raw_response)
+        refined_segments = _json_loads(cleaned_json)
+        total_words = sum(len(seg.get("text", "").split()) for seg in refined_segments)
+        formatted_text = format_segments_to_txt(refined_segments)
+        total_chars = len(formatted_text)
+
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write(formatted_text)
+        success = True
+    except Exception as e:
+        tqdm.write(f"Failed to parse/save {basename} → {e}")
+
+    log_result(log_path, [video_name, f"{basename}.txt", total_chars, total_words, video_found, success])
+
+def refine_transcript(client, api_key, model_name, basename, input_dir, videos_dir, refined_output_dir, log_path) -> bool:
+    """
+    Refines a single raw transcript ({basename}.json) and logs the result.
+    Returns False if the transcript could not be loaded or was empty.
+    """
+    payload = load_transcript_payload(basename, input_dir)
+    if payload is None:
+        return False
+
+    raw_response = None
+    while raw_response is None:
+        raw_response = refine_with_llm(payload, model_name, api_key, client)
+
+    save_refined_transcript(raw_response, basename, videos_dir, refined_output_dir, log_path)
+    return True
+
+async def refine_transcript_async(client, model_name, basename, input_dir, videos_dir, refined_output_dir, log_path, video_index=None) -> bool:
+    """
+    Async version of refine_transcript. File I/O runs in worker threads so it does not
+    block the other requests in flight.
+    """
+    payload = await asyncio.to_thread(load_transcript_payload, basename, input_dir)
+    if payload is None:
+        return False
+
+    raw_response = None
+    while raw_response is None:
+        raw_response = await refine_with_llm_async(payload, model_name, client)
+
+    await asyncio.to_thread(save_refined_transcript, raw_response, basename, videos_dir, refined_output_dir, log_path, video_index)
+    return True
+
+async def refine_all_async(client, to_process, model_name, input_dir, videos_dir, refined_output_dir, log_path, delay, max_concurrent):
+    """
+    Refines transcripts with up to `max_concurrent` requests in flight. Each slot waits
+    `delay` seconds after its call, keeping the configured spacing per slot.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    # Videos do not change during a batch run: scan the folder once
+    video_index = build_video_index(videos_dir)
+
+    with tqdm(total=len(to_process), desc="Refining") as pbar:
+        async def worker(basename):
+            async with semaphore:
+                try:
+                    called = await refine_transcript_async(client, model_name, basename, input_dir, videos_dir, refined_output_dir, log_path, video_index)
+                except Exception as e:
+                    tqdm.write(f"❌ Error refining {basename}: {e}")
+                    called = False
+                pbar.update(1)
+                if called and pbar.n < pbar.total:
+                    await asyncio.sleep(delay)
+
+        try:
+            await asyncio.gather(*(worker(basename) for basename in to_process))
+        finally:
+            await client.close()
+
+def setup_refiner_client(refined_output_dir, log_path, use_async=False):
+    """
+    Prepares the output folders and log, and returns (client, api_key) or (None, None).
+    With use_async=True the client is an AsyncCerebras.
+    The client keeps a pooled HTTP/2 connection for the whole run; close it when done.
+    """
     os.makedirs(refined_output_dir, exist_ok=True)
-    os.makedirs(full_response_dir, exist_ok=True)
+    os.makedirs(os.path.join(refined_output_dir, 'full_responses'), exist_ok=True)
     setup_csv_log(log_path)
 
     api_key = get_api_key()
     if not api_key:
         print("❌ CEREBRAS_API_KEY not found! Please set it in Colab Secrets or your .env file.")
-        return
+        return None, None
 
-    client = Cerebras(api_key=api_key)
+    # Keep-alive pool so TLS/TCP setup is paid once per run, not once per transcript
+    http_options = dict(http2=True, timeout=120.0, limits=httpx.Limits(max_keepalive_connections=16, max_connections=32))
+    if use_async:
+        return AsyncCerebras(api_key=api_key, http_client=httpx.AsyncClient(**http_options)), api_key
+    return Cerebras(api_key=api_key, http_client=httpx.Client(**http_options)), api_key
+
+def run_refiner_pipeline(input_dir, videos_dir, refined_output_dir, log_path, model_name, delay, max_files, max_concurrent=4):
+    print("\n=== TRANSCRIPT REFINEMENT PIPELINE ===\n")
 
-    # Find files
+    # Find files first, so a run with nothing to do never opens the client's HTTP pool
     try:
-        raw = {os.path.splitext(f)[0] for f in os.listdir(input_dir) if f.endswith('.json')}
-        done = {os.path.splitext(f)[0] for f in os.listdir(refined_output_dir) if f.endswith('.txt')}
+        raw = {e.name[:-5] for e in os.scandir(input_dir) if e.name.endswith('.json') and e.is_file(follow_symlinks=False)}
     except FileNotFoundError as e:
         print(f"Directory not found: {e}")
         return
+    done = set()
+    if os.path.isdir(refined_output_dir):
+        done = {e.name[:-4] for e in os.scandir(refined_output_dir) if e.name.endswith('.txt') and e.is_file(follow_symlinks=False)}
 
     to_process = sorted(raw - done)[:max_files]
     if not to_process:
         print("✅ All transcripts already refined!")
         return
 
-    print(f"Processing {len(to_process)} transcript(s)...\n")
-
-    for basename in tqdm(to_process, desc="Refining"):
-        video_name, video_found = find_matching_video(videos_dir, basename)
-        
-        json_path = os.path.join(input_dir, f"{basename}.json")
-        txt_path = os.path.join(refined_output_dir, f"{basename}.txt")
-        full_path = os.path.join(full_response_dir, f"{basename}_full_response.txt")
-
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                segments = json.load(f)
-        except Exception as e:
-            tqdm.write(f"Failed to load {basename}.json → {e}")
-            continue
-
-        if not segments:
-            continue
-
-        payload = json.dumps(segments, indent=4)
-        
-        raw_response = None
-        while raw_response is None:
-            raw_response = refine_with_llm(payload, model_name, api_key, client)
+    # refine_all_async closes the client when the batch ends
+    client, api_key = setup_refiner_client(refined_output_dir, log_path, use_async=True)
+    if not client:
+        return
 
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(raw_response)
+    print(f"Processing {len(to_process)} transcript(s)...\n")
 
-        success = False
-        total_chars = total_words = 0
-        try:
-            cleaned_json = parse_llm_json_output(raw_response)
-            refined_segments = json.loads(cleaned_json)
-            total_words = sum(len(seg.get("text", "").split()) for seg in refined_segments)
-            formatted_text = format_segments_to_txt(refined_segments)
-            total_chars = len(formatted_text)
-
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(formatted_text)
-            success = True
-        except Exception as e:
-            tqdm.write(f"Failed to parse/save {basename} → {e}")
-
-        log_result(log_path, [video_name, f"{basename}.txt", total_chars, total_words, video_found, success])
-
-        if basename != to_process[-1]:
-            time.sleep(delay)
+    asyncio.run(refine_all_async(client, to_process, model_name, input_dir, videos_dir, refined_output_dir, log_path, delay, max_concurrent))
 
     print("\nRefinement process completed.")
\ No newline at end of file
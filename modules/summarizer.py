@@ -1,6 +1,20 @@
 # Merges logs into a final dataset CSV
-import pandas as pd
 import os
+import csv
+
+# Output column → (source CSV, source column); 'log' is the refinement log, 'meta' the download metadata
+SUMMARY_COLUMNS = {
+    'title': ('meta', 'title'),
+    'video_name': ('log', 'video_name'),
+    'transcript_name': ('log', 'transcript_name'),
+    'audio_name': ('meta', 'audio_filename'),
+    'duration_seconds': ('meta', 'duration_seconds'),
+    'word_count': ('log', 'total_words'),
+    'channel_name': ('meta', 'channel_name'),
+    'url': ('meta', 'url'),
+    'download_name': ('meta', 'filename'),
+    'download_date': ('meta', 'download_date'),
+}
 
 def create_dataset_info(metadata_path, log_path, output_file):
     print("=== CREATING DATASET INFO ===\n")
@@ -13,68 +27,45 @@ def create_dataset_info(metadata_path, log_path, output_file):
         print(f"❌ Error: Log file not found at {log_path}")
         return
 
-    # 2. Load DataFrames
+    # 2. Load the metadata as a hash index on filename, and the log rows
     try:
-        df_meta = pd.read_csv(metadata_path)
-        df_log = pd.read_csv(log_path)
+        meta_by_filename = {}
+        with open(metadata_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                meta_by_filename.setdefault(row.get('filename'), []).append(row)
+        with open(log_path, 'r', newline='', encoding='utf-8') as f:
+            log_rows = list(csv.DictReader(f))
         print("✅ Files loaded successfully.")
     except Exception as e:
         print(f"❌ Error reading CSV files: {e}")
         return
 
-    # 3. Merge DataFrames
-    # We join where log['video_name'] matches metadata['filename']
+    # 3. Join where log['video_name'] matches metadata['filename'] (inner join, log order)
     print("Merging data...")
-    # Ensure string types for merging keys to avoid mismatches
-    df_log['video_name'] = df_log['video_name'].astype(str)
-    df_meta['filename'] = df_meta['filename'].astype(str)
-
-    merged_df = pd.merge(
-        df_log,
-        df_meta,
-        left_on='video_name',
-        right_on='filename',
-        how='inner'
-    )
+    summary_rows = []
+    try:
+        for log_row in log_rows:
+            for meta_row in meta_by_filename.get(log_row.get('video_name'), ()):
+                sources = {'log': log_row, 'meta': meta_row}
+                summary_rows.append({out: sources[src][col] for out, (src, col) in SUMMARY_COLUMNS.items()})
+    except KeyError as e:
+        print(f"❌ Error: Column {e} not found in the input CSVs.")
+        return
 
-    if merged_df.empty:
+    if not summary_rows:
         print("⚠️ Warning: The merged dataset is empty. Check if filenames match between the two CSVs.")
         return
 
-    # 4. Create Final DataFrame with requested columns
-    final_df = pd.DataFrame()
-
-    # Use .get() or direct access if you are sure columns exist. 
-    # Using direct access based on your notebook code, but adding checks is safer.
-    final_df['title'] = merged_df['title']
-    final_df['video_name'] = merged_df['video_name']
-    final_df['transcript_name'] = merged_df['transcript_name']
-    
-    # Mapping 'audio_filename' from metadata to 'audio_name'
-    final_df['audio_name'] = merged_df['audio_filename']
-
-    # Taking duration from metadata
-    final_df['duration_seconds'] = merged_df['duration_seconds']
-
-    # Mapping 'total_words' from log to 'word_count'
-    final_df['word_count'] = merged_df['total_words']
-
-    final_df['channel_name'] = merged_df['channel_name']
-    final_df['url'] = merged_df['url']
-
-    # Mapping 'filename' from metadata to 'download_name'
-    final_df['download_name'] = merged_df['filename']
-
-    # Mapping 'download_date'
-    final_df['download_date'] = merged_df['download_date']
-
-    # 5. Save to CSV
+    # 4. Save to CSV
     try:
-        final_df.to_csv(output_file, index=False)
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(SUMMARY_COLUMNS))
+            writer.writeheader()
+            writer.writerows(summary_rows)
         print("\n" + "="*30)
         print("       SUCCESS       ")
         print("="*30)
-        print(f"Merged {len(final_df)} records.")
+        print(f"Merged {len(summary_rows)} records.")
         print(f"Saved to: {os.path.abspath(output_file)}")
     except Exception as e:
-        print(f"❌ Error saving summary file: {e}")
\ No newline at end of file
+        print(f"❌ Error saving summary file: {e}")
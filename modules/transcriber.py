@@ -1,42 +1,141 @@
-# Whisper AI transcription logic
+# Whisper AI transcription logic (faster-whisper / CTranslate2 backend)
 import os
-import whisper
-import torch
+import ctranslate2
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 import json
+import wave
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-def transcribe_audio_files(input_dir: str, output_dir: str, model_size: str = 'large', device: str = None):
-    """
-    Transcribes all .wav files in the input directory using Whisper.
-    """
-    print("--- Starting Audio Transcription Process ---")
+# orjson is much faster than the stdlib encoder; both variants return indented UTF-8 bytes
+try:
+    import orjson
 
-    # 1. Setup directories and check for GPU
-    os.makedirs(output_dir, exist_ok=True)
-    
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+# Loaded models, so later steps in the same process (e.g. the catch-up transcription
+# after the streaming stage) reuse the weights already on the GPU
+_MODEL_CACHE = {}
+
+def resolve_device(device: str = None) -> str:
+    """Returns the requested device, or CUDA when available and none was given."""
     if device is None:
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        
+        device = 'cuda' if ctranslate2.get_cuda_device_count() > 0 else 'cpu'
+    return device
+
+def load_whisper_model(model_size: str = 'large', device: str = None, compute_type: str = None, batch_size: int = 16):
+    """
+    Loads the Whisper model on the given device. Weights default to int8 with float16
+    activations on GPU and int8 on CPU. With batch_size > 1 the model is wrapped in a
+    BatchedInferencePipeline; pass the same batch_size to transcribe_file.
+    Models are cached per process, so repeated calls reuse the loaded weights.
+    Returns None if loading fails.
+    """
+    device = resolve_device(device)
+    if compute_type is None:
+        compute_type = 'int8_float16' if device == 'cuda' else 'int8'
+    batched = bool(batch_size and batch_size > 1)
+    cache_key = (model_size, device, compute_type, batched)
+    if cache_key in _MODEL_CACHE:
+        return _MODEL_CACHE[cache_key]
     print(f"Using device: {device.upper()}")
     if device == 'cpu':
         print("⚠️ WARNING: No GPU found. Transcription will be very slow.")
 
-    # 2. Load the pre-trained Whisper model
-    print(f"Loading Whisper model ({model_size})...")
+    print(f"Loading Whisper model ({model_size}, {compute_type})...")
     try:
-        model = whisper.load_model(model_size, device=device)
+        model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                             cpu_threads=os.cpu_count() or 0, num_workers=2)
+        if batched:
+            model = BatchedInferencePipeline(model=model)
         print("✅ Model loaded successfully.")
+        _MODEL_CACHE[cache_key] = model
+        return model
     except Exception as e:
         print(f"❌ Error loading Whisper model: {e}")
-        return
+        return None
+
+def load_audio(input_path: str):
+    """
+    Reads a 16kHz mono 16-bit WAV (the format the downloader writes) straight into a
+    float32 array, skipping faster-whisper's decode and resample pass. For any other
+    file the path is returned, and faster-whisper decodes and resamples it itself.
+    """
+    try:
+        with wave.open(input_path, 'rb') as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (16000, 1, 2):
+                return input_path
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return input_path
+    return np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+
+def write_transcript(segments: list, output_path: str):
+    """Saves timestamped segments as JSON."""
+    try:
+        with open(output_path, 'wb') as f:
+            f.write(_json_dumps(segments))
+    except Exception as e:
+        tqdm.write(f"❌ Error writing {os.path.basename(output_path)}: {e}")
 
-    # 3. Identify audio files to process
+def transcribe_file(model, input_path: str, output_path: str, writer: ThreadPoolExecutor = None, batch_size: int = None) -> bool:
+    """
+    Transcribes a single audio file and saves its timestamped segments as JSON.
+    With a `writer` executor the JSON is written in the background, so the caller
+    can move on to the next file before it is on disk.
+    `batch_size` must match the one the model was loaded with.
+    """
+    try:
+        # Perform transcription (segments are decoded lazily while iterating)
+        options = {'beam_size': 5, 'vad_filter': True}
+        if batch_size and batch_size > 1:
+            # The encoder sees several 30s windows at once
+            options['batch_size'] = batch_size
+        result, _ = model.transcribe(load_audio(input_path), **options)
+
+        # Extract segments
+        segments = [
+            {
+                "start": round(seg.start, 1),
+                "end": round(seg.end, 1),
+                "text": seg.text.strip()
+            }
+            for seg in result
+        ]
+
+        # Save JSON
+        if writer is not None:
+            writer.submit(write_transcript, segments, output_path)
+        else:
+            write_transcript(segments, output_path)
+        return True
+
+    except Exception as e:
+        tqdm.write(f"❌ Error transcribing {os.path.basename(input_path)}: {e}")
+        return False
+
+def transcribe_audio_files(input_dir: str, output_dir: str, model_size: str = 'large', device: str = None,
+                           compute_type: str = None, batch_size: int = 16):
+    """
+    Transcribes all .wav files in the input directory using faster-whisper.
+    """
+    print("--- Starting Audio Transcription Process ---")
+
+    # 1. Setup directories
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 2. Identify audio files to process (before paying for the model load)
     if not os.path.exists(input_dir):
         print(f"❌ Input directory not found: {input_dir}")
         return
 
-    audio_files = {os.path.splitext(f)[0] for f in os.listdir(input_dir) if f.endswith('.wav')}
-    transcribed_files = {os.path.splitext(f)[0] for f in os.listdir(output_dir) if f.endswith('.json')}
+    audio_files = {e.name[:-4] for e in os.scandir(input_dir) if e.name.endswith('.wav') and e.is_file(follow_symlinks=False)}
+    transcribed_files = {e.name[:-5] for e in os.scandir(output_dir) if e.name.endswith('.json') and e.is_file(follow_symlinks=False)}
     files_to_process = sorted([f + '.wav' for f in (audio_files - transcribed_files)])
 
     if not files_to_process:
@@ -45,31 +144,18 @@ def transcribe_audio_files(input_dir: str, output_dir: str, model_size: str = 'l
 
     print(f"Found {len(files_to_process)} audio file(s) to transcribe.")
 
-    # 4. Process each audio file
-    for filename in tqdm(files_to_process, desc="Transcribing Audio"):
-        input_path = os.path.join(input_dir, filename)
-        output_filename = f"{os.path.splitext(filename)[0]}.json"
-        output_path = os.path.join(output_dir, output_filename)
-
-        try:
-            # Perform transcription
-            result = model.transcribe(input_path, fp16=torch.cuda.is_available())
-
-            # Extract segments
-            segments = [
-                {
-                    "start": round(seg["start"], 1),
-                    "end": round(seg["end"], 1),
-                    "text": seg["text"].strip()
-                }
-                for seg in result["segments"]
-            ]
-
-            # Save JSON
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(segments, f, indent=4, ensure_ascii=False)
-
-        except Exception as e:
-            tqdm.write(f"❌ Error transcribing {filename}: {e}")
-
-    print("\n--- Audio Transcription process completed. ---")
\ No newline at end of file
+    # 3. Load the pre-trained Whisper model
+    model = load_whisper_model(model_size, device, compute_type, batch_size)
+    if model is None:
+        return
+
+    # 4. Process each audio file; one background thread writes the JSON files
+    #    while the model decodes the next file
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for filename in tqdm(files_to_process, desc="Transcribing Audio"):
+            input_path = os.path.join(input_dir, filename)
+            output_filename = f"{os.path.splitext(filename)[0]}.json"
+            output_path = os.path.join(output_dir, output_filename)
+            transcribe_file(model, input_path, output_path, writer, batch_size)
+
+    print("\n--- Audio Transcription process completed. ---")
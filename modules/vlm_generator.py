@@ -1,12 +1,35 @@
 import os
 import json
-import pandas as pd
 from tqdm import tqdm
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import csv
+import re
 import time
+import asyncio
+import mmap
+import hashlib
+import tempfile
+import httpx
+from aiolimiter import AsyncLimiter
+
+# orjson is much faster; both variants return bytes from _json_dumps
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+# pyahocorasick counts every surgical term in one linear pass (see _prefilter)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # --- PROMPTS ---
 
@@ -78,9 +101,115 @@ Output Format (JSON):
 
 Transcript: {transcript_text}"""
 
+def split_prompt_template(template):
+    """
+    Splits a prompt template around its {transcript_text} field into (prefix, suffix),
+    with the doubled braces already unescaped, so a prompt is built by concatenation.
+    """
+    prefix, suffix = template.split("{transcript_text}")
+    return tuple(part.replace("{{", "{").replace("}}", "}") for part in (prefix, suffix))
+
+GATEKEEPER_PREFIX, GATEKEEPER_SUFFIX = split_prompt_template(GATEKEEPER_PROMPT)
+ANALYST_PREFIX, ANALYST_SUFFIX = split_prompt_template(ANALYST_PROMPT)
+
+
+# The gatekeeper only ever sees the start of a transcript, bounded in UTF-8 bytes so
+# the prompt size does not depend on the script the transcript is written in
+GATEKEEPER_MAX_BYTES = 25000
+
+# Cheap gate before the gatekeeper LLM: transcripts that are (nearly) empty, only
+# non-verbal markers, or never mention a surgical term are rejected without an API call
+_PREFILTER_MIN_CHARS = 50
+_PREFILTER_MIN_TERMS = 3
+_MARKER_RE = re.compile(r'\[(music|silence|applause|inaudible|laughter|noise)\]', re.IGNORECASE)
+# Segment prefixes written by the refiner ("[MM:SS - MM:SS]: text"), stripped before the checks
+_TIMESTAMP_RE = re.compile(r'^\[[\d:.]+ - [\d:.]+\]:[ \t]*', re.MULTILINE)
+# Word stems: a term counts wherever one of these starts a word
+SURGICAL_TERMS = (
+    'cataract', 'phaco', 'lens', 'iol', 'capsul', 'rhexis', 'cornea', 'incision', 'wound', 'chamber',
+    'iris', 'pupil', 'zonul', 'nucleus', 'cortex', 'cortical', 'epinucle', 'chop', 'sculpt', 'groove',
+    'crack', 'hydrodissect', 'hydrodelineat', 'viscoelastic', 'ovd', 'healon', 'irrigat', 'aspirat',
+    'forceps', 'cannula', 'keratome', 'spatula', 'hook', 'cystotome', 'vitre', 'retina', 'sclera',
+    'limb', 'suture', 'stitch', 'anesthe', 'anaesthe', 'surg', 'patient', 'eye',
+)
+
+if ahocorasick is not None:
+    _SURGICAL_TERMS_AUTOMATON = ahocorasick.Automaton()
+    for _term in SURGICAL_TERMS:
+        _SURGICAL_TERMS_AUTOMATON.add_word(_term, len(_term))
+    _SURGICAL_TERMS_AUTOMATON.make_automaton()
+else:
+    _SURGICAL_TERMS_RE = re.compile(r'\b(?:' + '|'.join(SURGICAL_TERMS) + r')', re.IGNORECASE)
+
+def count_surgical_terms(text, limit):
+    """Counts surgical term occurrences in `text`, stopping once `limit` is reached."""
+    hits = 0
+    if ahocorasick is not None:
+        text = text.lower()
+        for end, length in _SURGICAL_TERMS_AUTOMATON.iter(text):
+            start = end - length + 1
+            # Same word-start rule as the regex's \b
+            if start == 0 or not (text[start - 1].isalnum() or text[start - 1] == '_'):
+                hits += 1
+                if hits >= limit:
+                    break
+    else:
+        for _ in _SURGICAL_TERMS_RE.finditer(text):
+            hits += 1
+            if hits >= limit:
+                break
+    return hits
+
+def _prefilter(text):
+    """
+    Returns a NO decision (shaped like the gatekeeper's) when the transcript can be
+    rejected without the LLM, or None when the gatekeeper has to decide.
+    """
+    text = _TIMESTAMP_RE.sub('', text)
+    if len(text.strip()) < _PREFILTER_MIN_CHARS:
+        reason = "Prefilter: transcript is empty or too short."
+    elif not _MARKER_RE.sub('', text).strip():
+        reason = "Prefilter: transcript contains only non-verbal markers."
+    elif count_surgical_terms(text, _PREFILTER_MIN_TERMS) < _PREFILTER_MIN_TERMS:
+        reason = "Prefilter: (almost) no surgical terminology found."
+    else:
+        return None
+    return {"decision": "NO", "confidence_score": 1.0, "reasoning": reason}
 
-def get_gemini_client():
-    """Initializes the Google GenAI client."""
+def utf8_head(data, max_bytes):
+    """
+    Decodes at most `max_bytes` of UTF-8 `data` (bytes or mmap), cutting on a
+    character boundary: if the first byte past the cut is a continuation byte
+    (0b10xxxxxx), the cut steps back to the start of that character. Invalid
+    bytes in the file itself are replaced, as the gatekeeper only screens the text.
+    """
+    if len(data) <= max_bytes:
+        return data[:].decode('utf-8', 'replace')
+    end = max_bytes
+    while end > 0 and (data[end] & 0xC0) == 0x80:
+        end -= 1
+    return data[:end].decode('utf-8', 'replace')
+
+def read_transcript(path, max_bytes=None):
+    """
+    Reads a transcript. With max_bytes only the head of the file is copied (through
+    mmap) and decoded (see utf8_head); the full text is a plain read.
+    """
+    if max_bytes is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    with open(path, 'rb') as f:
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return utf8_head(mm, max_bytes)
+
+# Per-request timeout (ms); generator calls over a whole video can take minutes
+GEMINI_TIMEOUT_MS = 600_000
+
+def get_gemini_api_key():
+    """Looks up GEMINI_API_KEY (Colab secrets, then the environment / .env)."""
     # Try getting key from Colab secrets first
     try:
         from google.colab import userdata
@@ -98,36 +227,49 @@ def get_gemini_client():
     if not api_key:
         print("❌ Error: GEMINI_API_KEY not found. Please set it in .env or Colab Secrets.")
         return None
-        
-    return genai.Client(api_key=api_key)
+    return api_key
+
+def get_gemini_client(api_key, http_client=None):
+    """
+    Initializes the Google GenAI client. With `http_client` (an httpx.AsyncClient),
+    all async calls share its connection pool instead of the SDK's default one.
+    """
+    if http_client is None:
+        return genai.Client(api_key=api_key)
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(
+        timeout=GEMINI_TIMEOUT_MS, httpx_async_client=http_client
+    ))
 
-def check_transcript_quality(client, model_name, transcript_text):
+async def check_transcript_quality(client, model_name, transcript_text):
     """
     Step 1: Gatekeeper
     Uses a fast model to decide if the transcript is worth processing.
     """
     try:
         # Truncate transcript to avoid token limits on the gatekeeper if extremely long.
-        prompt = GATEKEEPER_PROMPT.format(transcript_text=transcript_text[:25000])
+        # Fewer than a quarter as many characters as the budget always fit (<= 4 bytes each).
+        if len(transcript_text) * 4 > GATEKEEPER_MAX_BYTES:
+            transcript_text = utf8_head(transcript_text.encode('utf-8'), GATEKEEPER_MAX_BYTES)
+        prompt = GATEKEEPER_PREFIX + transcript_text + GATEKEEPER_SUFFIX
         
-        response = client.models.generate_content(
+        response = await client.aio.models.generate_content(
             model=model_name,
             contents=prompt,
             config=types.GenerateContentConfig(
                 response_mime_type="application/json"
             )
         )
-        return json.loads(response.text)
+        return _json_loads(response.text)
     except Exception as e:
         return {"decision": "ERROR", "reasoning": str(e)}
 
-def generate_vlm_entry(client, model_name, video_url, transcript_text):
+async def generate_vlm_entry(client, model_name, video_url, transcript_text):
     """
     Step 2: Generator
     Uses a powerful model to watch the video (via URL) and analyze it with the transcript.
     """
     try:
-        formatted_prompt = ANALYST_PROMPT.format(transcript_text=transcript_text)
+        formatted_prompt = ANALYST_PREFIX + transcript_text + ANALYST_SUFFIX
         
         contents = [
             types.Content(
@@ -144,18 +286,55 @@ def generate_vlm_entry(client, model_name, video_url, transcript_text):
             # thinking_config=types.ThinkingConfig(thinking_budget=1024) 
         )
 
-        response = client.models.generate_content(
+        # Stream the answer so it is received while the model is still generating
+        chunks = []
+        async for chunk in await client.aio.models.generate_content_stream(
             model=model_name,
             contents=contents,
             config=generate_content_config,
-        )
+        ):
+            if chunk.text:
+                chunks.append(chunk.text)
         
-        return json.loads(response.text)
+        return _json_loads("".join(chunks))
 
     except Exception as e:
-        print(f"  ⚠️ VLM Generation failed for {video_url}: {e}")
+        tqdm.write(f"  ⚠️ VLM Generation failed for {video_url}: {e}")
+        return None
+
+# Generator responses keyed by content, so re-uploads with an identical transcript
+# reuse the earlier answer instead of another generator call
+RESPONSE_CACHE_DIRNAME = ".cache"
+
+def response_cache_key(model_name, transcript_text):
+    """Hash of everything that determines the generator's answer besides the video."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in (model_name, ANALYST_PROMPT, transcript_text):
+        h.update(part.encode('utf-8'))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def load_cached_response(cache_dir, key):
+    """Returns the cached annotations for `key`, or None on a miss or unreadable entry."""
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json"), 'rb') as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
         return None
 
+def save_cached_response(cache_dir, key, vlm_data):
+    """Writes a cache entry atomically (temp file + rename), so readers never see half a file."""
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_json_dumps(vlm_data))
+        os.replace(tmp_path, os.path.join(cache_dir, f"{key}.json"))
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
 def setup_log_csv(log_path):
     """Creates the CSV log file with headers if it doesn't exist."""
     headers = [
@@ -167,22 +346,83 @@ def setup_log_csv(log_path):
             writer = csv.writer(f)
             writer.writerow(headers)
 
-def append_to_log_csv(log_path, data):
-    """Appends a single row to the CSV log."""
-    with open(log_path, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            data.get("video_id"),
-            data.get("original_filename"),
-            data.get("status"),
-            data.get("decision"),
-            data.get("confidence"),
-            data.get("reasoning"),
-            data.get("video_title"),
-            data.get("url"),
-            data.get("download_date"),
-            time.strftime("%Y-%m-%d %H:%M:%S")
-        ])
+class BufferedAppender:
+    """
+    Keeps a file open in append mode for the whole run instead of reopening it per
+    row. Writes are buffered and flushed every `flush_every` writes and on close.
+    Has a write() method, so it can back a csv.writer (one write per row).
+    """
+    def __init__(self, path, flush_every=16, newline=None):
+        self._f = open(path, 'a', newline=newline, encoding='utf-8', buffering=1 << 20)
+        self.flush_every = flush_every
+        self._pending = 0
+
+    def write(self, text):
+        self._f.write(text)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self._f.flush()
+        self._pending = 0
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_all(fd, data):
+    """Writes all of `data` to a raw file descriptor (os.write may write less than asked)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def save_vlm_entry(individual_file_path, aggregate_fd, line):
+    """Writes one encoded entry to its individual JSONL and appends it to the aggregate."""
+    # 1. Save INDIVIDUAL JSONL using stable ID
+    fd = os.open(individual_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        write_all(fd, line)
+    finally:
+        os.close(fd)
+
+    # 2. Append to AGGREGATE JSONL (one O_APPEND write per entry)
+    write_all(aggregate_fd, line)
+
+def append_to_log_csv(log_writer, data):
+    """Appends a single row to the CSV log through a csv.writer."""
+    log_writer.writerow([
+        data.get("video_id"),
+        data.get("original_filename"),
+        data.get("status"),
+        data.get("decision"),
+        data.get("confidence"),
+        data.get("reasoning"),
+        data.get("video_title"),
+        data.get("url"),
+        data.get("download_date"),
+        time.strftime("%Y-%m-%d %H:%M:%S")
+    ])
+
+def log_video(log_writer, job, status, decision, confidence, reasoning):
+    """Appends the outcome for one video job to the CSV log."""
+    append_to_log_csv(log_writer, {
+        "video_id": job["video_id"],
+        "original_filename": job["original_filename"],
+        "status": status,
+        "decision": decision,
+        "confidence": confidence,
+        "reasoning": reasoning,
+        "video_title": job["video_title"],
+        "url": job["url"],
+        "download_date": job["download_date"]
+    })
 
 def get_stable_id(filename_or_name):
     """
@@ -193,11 +433,151 @@ def get_stable_id(filename_or_name):
         return None
     return os.path.splitext(str(filename_or_name))[0]
 
-def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, aggregate_filename, log_filename, gatekeeper_model, generator_model):
+async def process_videos_async(client, jobs, output_dir, aggregate_fd, log_writer,
+                               gatekeeper_model, generator_model, max_concurrency, generator_rpm,
+                               gatekeeper_concurrency=16, prefilter=True, gatekeeper_rpm=60):
+    """
+    Phase 1 runs the cheap gatekeeper over every pending transcript (up to
+    `gatekeeper_concurrency` at once and `gatekeeper_rpm` calls per minute, after the
+    `prefilter` heuristics when enabled) and logs rejections right away; failed
+    gatekeeper calls are logged as ERROR_GATEKEEPER and retried on the next run. Phase 2 runs the
+    generator only for accepted videos, up to `max_concurrency` at once and at most
+    `generator_rpm` calls per minute; answers are cached in `output_dir`/.cache by
+    transcript hash. Returns (success_count, skip_count, error_count).
+    """
+    counts = {"success": 0, "skip": 0, "error": 0, "cached": 0}
+
+    def tick(pbar):
+        # Status lives in the bar's postfix, redrawn with the bar instead of a line per video
+        pbar.set_postfix_str(
+            f"ok={counts['success']} skip={counts['skip']} err={counts['error']} cached={counts['cached']}", refresh=False
+        )
+        pbar.update(1)
+
+    # --- PHASE 1: GATEKEEPER ---
+    gatekeeper_semaphore = asyncio.Semaphore(gatekeeper_concurrency)
+    gatekeeper_limiter = AsyncLimiter(gatekeeper_rpm, 60)
+    with tqdm(total=len(jobs), desc="Gatekeeper") as pbar:
+        async def gatekeep(job):
+            try:
+                await gatekeep_video(job)
+            finally:
+                tick(pbar)
+
+        async def gatekeep_video(job):
+            async with gatekeeper_semaphore:
+                try:
+                    # Rejected videos never have their full transcript read
+                    transcript_head = await asyncio.to_thread(read_transcript, job["transcript_path"], GATEKEEPER_MAX_BYTES)
+                except Exception:
+                    counts["error"] += 1
+                    return
+                # Only ambiguous transcripts reach the gatekeeper model
+                quality_result = prefilter and _prefilter(transcript_head)
+                prefiltered = bool(quality_result)
+                if not prefiltered:
+                    async with gatekeeper_limiter:
+                        quality_result = await check_transcript_quality(client, gatekeeper_model, transcript_head)
+            decision = quality_result.get('decision', 'NO').upper()
+            reason = quality_result.get('reasoning', 'No reason provided')
+            confidence = quality_result.get('confidence_score', 0.0)
+
+            if decision == 'ERROR':
+                # Failed call (quota, timeout...), not a verdict: logged as retryable
+                counts["error"] += 1
+                log_video(log_writer, job, "ERROR_GATEKEEPER", decision, confidence, reason)
+                return
+            if decision != 'YES':
+                counts["skip"] += 1
+                # Log failure (heuristic rejections apart, so disabling the prefilter re-screens them)
+                log_video(log_writer, job, "REJECTED_PREFILTER" if prefiltered else "REJECTED", decision, confidence, reason)
+                return
+            job.update(quality_result=quality_result, decision=decision, reason=reason, confidence=confidence)
+
+        await asyncio.gather(*(gatekeep(job) for job in jobs))
+
+    accepted = [job for job in jobs if "quality_result" in job]
+    if not accepted:
+        return counts["success"], counts["skip"], counts["error"]
+
+    # --- PHASE 2: GENERATOR ---
+    generator_semaphore = asyncio.Semaphore(max_concurrency)
+    # Token bucket shared by all slots: only blocks when the per-minute quota is used up
+    generator_limiter = AsyncLimiter(generator_rpm, 60)
+    cache_dir = os.path.join(output_dir, RESPONSE_CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    with tqdm(total=len(accepted), desc="Generating VLM Data") as pbar:
+        async def generate(job):
+            async with generator_semaphore:
+                try:
+                    await generate_video(job)
+                finally:
+                    tick(pbar)
+
+        async def generate_video(job):
+            video_id = job["video_id"]
+            try:
+                transcript_text = await asyncio.to_thread(read_transcript, job["transcript_path"])
+            except Exception:
+                counts["error"] += 1
+                return
+            cache_key = response_cache_key(generator_model, transcript_text)
+            vlm_data = await asyncio.to_thread(load_cached_response, cache_dir, cache_key)
+            if vlm_data:
+                counts["cached"] += 1
+            else:
+                async with generator_limiter:
+                    vlm_data = await generate_vlm_entry(client, generator_model, job["url"], transcript_text)
+                if vlm_data:
+                    await asyncio.to_thread(save_cached_response, cache_dir, cache_key, vlm_data)
+            if vlm_data:
+                final_entry = {
+                    "video_id": video_id,
+                    "original_filename": job["original_filename"],
+                    "status": "SUCCESS",
+                    "video_url": job["url"],
+                    "video_title": job["video_title"],
+                    "download_date": job["download_date"],
+                    "transcript_quality_check": job["quality_result"],
+                    "vlm_annotations": vlm_data
+                }
+
+                # 1.-2. Save the individual and aggregate JSONL off the event loop
+                individual_file_path = os.path.join(output_dir, f"{video_id}.jsonl")
+                line = _json_dumps(final_entry) + b"\n"
+                await asyncio.to_thread(save_vlm_entry, individual_file_path, aggregate_fd, line)
+
+                # 3. Log SUCCESS
+                log_video(log_writer, job, "ACCEPTED", job["decision"], job["confidence"], job["reason"])
+                counts["success"] += 1
+            else:
+                counts["error"] += 1
+                # Log ERROR
+                log_video(log_writer, job, "ERROR_GENERATION", job["decision"], job["confidence"], "Model failed to generate valid JSON")
+
+        await asyncio.gather(*(generate(job) for job in accepted))
+
+    return counts["success"], counts["skip"], counts["error"]
+
+async def process_with_shared_pool(api_key, pool_size, jobs, *args):
+    """
+    Runs process_videos_async with one HTTP/2 pool for every concurrent Gemini call:
+    requests multiplex on kept-alive connections instead of each paying its own TLS
+    handshake. The pool lives on this event loop and is closed when the run ends.
+    """
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    async with httpx.AsyncClient(http2=True, limits=limits) as http_client:
+        return await process_videos_async(get_gemini_client(api_key, http_client), jobs, *args)
+
+def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, aggregate_filename, log_filename, gatekeeper_model, generator_model,
+                                max_concurrency=8, generator_rpm=8, gatekeeper_concurrency=16, prefilter=True,
+                                gatekeeper_rpm=60):
     print("\n=== VLM DATASET GENERATION PIPELINE ===\n")
+    # Imported here so loading the module (e.g. for other pipeline steps) stays cheap
+    import pandas as pd
 
-    client = get_gemini_client()
-    if not client:
+    api_key = get_gemini_api_key()
+    if not api_key:
         return
 
     # 1. Setup Directories and Files
@@ -213,7 +593,17 @@ def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, a
         print(f"❌ Summary file not found at: {dataset_summary_path}")
         return
     
-    df = pd.read_csv(dataset_summary_path)
+    # Only the columns used below, as plain strings (missing values become "")
+    try:
+        df = pd.read_csv(
+            dataset_summary_path,
+            usecols=['video_name', 'url', 'title', 'download_date', 'transcript_name'],
+            dtype=str,
+            keep_default_na=False
+        )
+    except ValueError as e:
+        print(f"❌ Summary file is missing required columns: {e}")
+        return
     if df.empty:
         print("⚠️ Summary file is empty.")
         return
@@ -221,21 +611,33 @@ def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, a
     # 3. Resume Logic
     # We look for files in the output directory that match {stable_id}.jsonl
     # This is more robust than just checking the log.
-    existing_files = set(os.listdir(output_dir))
+    done_ids = {e.name[:-6] for e in os.scandir(output_dir) if e.name.endswith('.jsonl')}
+    # The aggregate file is not a per-video result
+    done_ids.discard(get_stable_id(aggregate_filename))
     
     # We also check the CSV log to see if we explicitly REJECTED/SKIPPED specific IDs before
     # FIX: We only count it as "processed" if the status is ACCEPTED or REJECTED.
-    # If the status is ERROR_GENERATION, we want to retry it.
+    # If the status is ERROR_GENERATION or ERROR_GATEKEEPER, we want to retry it.
+    # REJECTED_PREFILTER only counts while the prefilter is on.
+    finished_statuses = {'ACCEPTED', 'REJECTED'}
+    if prefilter:
+        finished_statuses.add('REJECTED_PREFILTER')
     processed_log_ids = set()
     if os.path.exists(log_file_path):
         try:
-            log_df = pd.read_csv(log_file_path)
-            # Filter rows where the job was truly finished (Successful or permanently Rejected)
-            finished_df = log_df[log_df['status'].isin(['ACCEPTED', 'REJECTED'])]
-            processed_log_ids = set(finished_df['video_id'].astype(str))
+            # Streamed row by row; only rows where the job was truly finished (Successful or permanently Rejected)
+            with open(log_file_path, 'r', newline='', encoding='utf-8') as f:
+                processed_log_ids = {row['video_id'] for row in csv.DictReader(f)
+                                     if row.get('status') in finished_statuses}
             print(f"ℹ️ Resuming... {len(processed_log_ids)} completed videos found in log.")
         except Exception:
             pass
+    done_ids |= processed_log_ids
+
+    # Snapshot the refined transcripts once instead of stat-ing candidates per video
+    transcripts_by_name = {}
+    if os.path.isdir(refined_dir):
+        transcripts_by_name = {entry.name: entry.path for entry in os.scandir(refined_dir) if entry.is_file()}
 
     success_count = 0
     skip_count = 0
@@ -244,12 +646,14 @@ def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, a
 
     print(f"Processing {len(df)} videos from summary...\n")
 
-    for index, row in tqdm(df.iterrows(), total=len(df), desc="Generating VLM Data"):
+    # 4. Collect the videos still to process (resume checks and transcript lookup)
+    jobs = []
+    for row in df.itertuples(index=False):
         
-        raw_video_name = str(row.get('video_name', ''))
-        video_url = row.get('url', '')
-        video_title = row.get('title', '')
-        download_date = row.get('download_date', '')
+        raw_video_name = row.video_name
+        video_url = row.url
+        video_title = row.title
+        download_date = row.download_date
         
         if not raw_video_name or not video_url:
             continue
@@ -258,127 +662,52 @@ def run_vlm_generation_pipeline(dataset_summary_path, refined_dir, output_dir, a
         # Normalize the ID: "video.mp4" -> "video"
         video_id = get_stable_id(raw_video_name)
         
-        # --- CHECK 1: File Existence ---
-        # If video.jsonl exists, we are done.
-        expected_filename = f"{video_id}.jsonl"
-        if expected_filename in existing_files:
-            # tqdm.write(f"  ⏩ Skipping {video_id} (File exists)")
-            already_done_count += 1
-            continue
-
-        # --- CHECK 2: Log History ---
-        # If we logged this ID as successfully processed or definitively rejected, skip.
-        if video_id in processed_log_ids:
-            # tqdm.write(f"  ⏩ Skipping {video_id} (Found in log)")
+        # --- CHECK: already done ---
+        # Skip if video.jsonl exists, or we logged this ID as successfully processed
+        # or definitively rejected (or it is already queued from an earlier row).
+        if video_id in done_ids:
             already_done_count += 1
             continue
 
         # Locate transcript input
-        transcript_name = str(row.get('transcript_name', ''))
-        # Try finding the transcript using various naming conventions
-        # 1. Exact match from CSV
-        t_path_1 = os.path.join(refined_dir, transcript_name)
-        # 2. Replace extension with .txt
-        t_path_2 = os.path.join(refined_dir, f"{os.path.splitext(transcript_name)[0]}.txt")
-        # 3. Use video_id + .txt
-        t_path_3 = os.path.join(refined_dir, f"{video_id}.txt")
-
-        if os.path.exists(t_path_1):
-            final_t_path = t_path_1
-        elif os.path.exists(t_path_2):
-            final_t_path = t_path_2
-        elif os.path.exists(t_path_3):
-            final_t_path = t_path_3
-        else:
+        transcript_name = row.transcript_name
+        # Try finding the transcript using various naming conventions:
+        # 1. Exact match from CSV, 2. same name with .txt, 3. video_id + .txt
+        final_t_path = (
+            transcripts_by_name.get(transcript_name)
+            or transcripts_by_name.get(f"{get_stable_id(transcript_name)}.txt")
+            or transcripts_by_name.get(f"{video_id}.txt")
+        )
+        if not final_t_path:
             # If transcript is missing, we can't process
             error_count += 1
             continue
 
+        done_ids.add(video_id)
+        jobs.append({
+            "video_id": video_id,
+            "original_filename": raw_video_name,
+            "url": video_url,
+            "video_title": video_title,
+            "download_date": download_date,
+            "transcript_path": final_t_path
+        })
+
+    # 5. Gatekeeper for all pending videos, then the generator for the accepted ones
+    if jobs:
+        # Log and aggregate stay open for the run; the log is flushed every 16 rows,
+        # the aggregate is written unbuffered and synced to disk at the end
+        aggregate_fd = os.open(aggregate_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
         try:
-            with open(final_t_path, 'r', encoding='utf-8') as f:
-                transcript_text = f.read()
-        except Exception as e:
-            error_count += 1
-            continue
-
-        # --- STEP 1: GATEKEEPER ---
-        quality_result = check_transcript_quality(client, gatekeeper_model, transcript_text)
-        decision = quality_result.get('decision', 'NO').upper()
-        reason = quality_result.get('reasoning', 'No reason provided')
-        confidence = quality_result.get('confidence_score', 0.0)
-        
-        if decision != 'YES':
-            skip_count += 1
-            # Log failure
-            append_to_log_csv(log_file_path, {
-                "video_id": video_id,
-                "original_filename": raw_video_name,
-                "status": "REJECTED",
-                "decision": decision,
-                "confidence": confidence,
-                "reasoning": reason,
-                "video_title": video_title,
-                "url": video_url,
-                "download_date": download_date
-            })
-            continue
-
-        # --- STEP 2: GENERATOR ---
-        tqdm.write(f"  🎥 Analyze: {video_title}")
-        vlm_data = generate_vlm_entry(client, generator_model, video_url, transcript_text)
-        sleep_time = 60 # seconds
-        tqdm.write(f" ⏳ Waiting {sleep_time}s to avoid rate limits...")
-        time.sleep(sleep_time)
-        if vlm_data:
-            final_entry = {
-                "video_id": video_id,
-                "original_filename": raw_video_name,
-                "status": "SUCCESS",
-                "video_url": video_url,
-                "video_title": video_title,
-                "download_date": download_date,
-                "transcript_quality_check": quality_result,
-                "vlm_annotations": vlm_data
-            }
-
-            # 1. Save INDIVIDUAL JSONL using stable ID
-            individual_file_path = os.path.join(output_dir, expected_filename)
-            with open(individual_file_path, 'w', encoding='utf-8') as f:
-                f.write(json.dumps(final_entry) + "\n")
-
-            # 2. Append to AGGREGATE JSONL
-            with open(aggregate_file_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(final_entry) + "\n")
-            
-            # 3. Log SUCCESS
-            append_to_log_csv(log_file_path, {
-                "video_id": video_id,
-                "original_filename": raw_video_name,
-                "status": "ACCEPTED",
-                "decision": decision,
-                "confidence": confidence,
-                "reasoning": reason,
-                "video_title": video_title,
-                "url": video_url,
-                "download_date": download_date
-            })
-
-            success_count += 1
-        else:
-            error_count += 1
-            tqdm.write(f"  ❌ Failed to generate VLM data for {video_id}")
-            # Log ERROR
-            append_to_log_csv(log_file_path, {
-                "video_id": video_id,
-                "original_filename": raw_video_name,
-                "status": "ERROR_GENERATION",
-                "decision": decision,
-                "confidence": confidence,
-                "reasoning": "Model failed to generate valid JSON",
-                "video_title": video_title,
-                "url": video_url,
-                "download_date": download_date
-            })
+            with BufferedAppender(log_file_path, newline='') as log_file:
+                success_count, skip_count, generation_errors = asyncio.run(process_with_shared_pool(
+                    api_key, max(max_concurrency, gatekeeper_concurrency), jobs, output_dir, aggregate_fd, csv.writer(log_file),
+                    gatekeeper_model, generator_model, max_concurrency, generator_rpm, gatekeeper_concurrency, prefilter, gatekeeper_rpm
+                ))
+        finally:
+            os.fsync(aggregate_fd)
+            os.close(aggregate_fd)
+        error_count += generation_errors
 
     print("\n" + "="*30)
     print("   VLM GENERATION COMPLETED")